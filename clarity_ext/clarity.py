@@ -1,9 +1,88 @@
+import logging
+import threading
+import weakref
 from genologics.lims import Lims
 from genologics.config import BASEURI, USERNAME, PASSWORD
 import genologics.entities
 import requests
+from requests.adapters import HTTPAdapter
 from clarity_ext.domain.process import Process
 
+logger = logging.getLogger(__name__)
+
+
+class SessionRegistry(object):
+    """
+    Process-wide registry of connections to Clarity.
+
+    Connecting is relatively expensive, since every new connection requires a new handshake and a call for
+    checking the API version. The registry hands out one api object (looking like Lims from the genologics
+    package) per server and user. All of them share one keep-alive HTTP session with a connection pool
+    large enough for fetching concurrently, and the API version is checked only once per api object.
+
+    The shared session is only used by versions of the genologics package that keep their session in
+    `Lims.request_session`. Older versions connect through the requests module directly, so their api
+    objects are still shared, but their connections aren't pooled.
+    """
+    POOL_CONNECTIONS = 10
+    POOL_MAXSIZE = 20
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._apis = dict()
+        self._http_session = None
+        self._http_session_class = None
+        self._version_checked = weakref.WeakSet()
+
+    @property
+    def http_session(self):
+        """
+        Returns the shared HTTP session. A new one is created, and the api objects using the old one are
+        dropped, if requests.Session has been replaced since (e.g. when requests_cache is installed or
+        uninstalled).
+        """
+        with self._lock:
+            if self._http_session is None or self._http_session_class is not requests.Session:
+                http_session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=self.POOL_CONNECTIONS, pool_maxsize=self.POOL_MAXSIZE)
+                http_session.mount("http://", adapter)
+                http_session.mount("https://", adapter)
+                self._http_session = http_session
+                self._http_session_class = requests.Session
+                self._apis = dict()
+            return self._http_session
+
+    def api(self, base_uri, username, password):
+        """Returns the api object for the server and user, creating it on first use"""
+        with self._lock:
+            http_session = self.http_session
+            key = (base_uri, username, password)
+            if key not in self._apis:
+                api = Lims(base_uri, username, password)
+                if hasattr(api, "request_session"):
+                    # Newer versions of the genologics package keep their own session, use the shared one:
+                    api.request_session = http_session
+                else:
+                    logger.warning("The installed genologics package doesn't support sharing an HTTP session, "
+                                   "connections to {} are not pooled".format(base_uri))
+                self._apis[key] = api
+            return self._apis[key]
+
+    def check_version(self, api):
+        """Checks the API version, unless it has already been checked for this api object"""
+        with self._lock:
+            if api not in self._version_checked:
+                api.check_version()
+                self._version_checked.add(api)
+
+    def reset(self):
+        """Drops all connections. New ones will be created on next use."""
+        with self._lock:
+            self._apis = dict()
+            self._http_session = None
+            self._http_session_class = None
+            self._version_checked = weakref.WeakSet()
+
 
 class ClaritySession(object):
     """
@@ -12,9 +91,11 @@ class ClaritySession(object):
     :param api: A proxy for the REST API, looking like Lims from the genologics package.
     :param current_step_id: The step we're currently in.
     """
+    registry = SessionRegistry()
+
     def __init__(self, api, current_step_id):
         self.api = api
-        api.check_version()
+        self.registry.check_version(api)
         self.current_step_id = current_step_id
         if current_step_id:
             process_api_resource = genologics.entities.Process(self.api, id=current_step_id)
@@ -22,12 +103,14 @@ class ClaritySession(object):
 
     @staticmethod
     def create(current_step_id):
-        return ClaritySession(Lims(BASEURI, USERNAME, PASSWORD), current_step_id)
+        return ClaritySession(ClaritySession.registry.api(BASEURI, USERNAME, PASSWORD), current_step_id)
 
-    def get(self, endpoint):
+    def get(self, endpoint, **kwargs):
         """
         Executes a GET via the REST interface. One should rather use the api attribute instead.
         The endpoint is the part after /api/<version>/ in the API URI.
+
+        Keyword arguments are passed on to requests, e.g. stream=True.
         """
         url = "{}/api/v2/{}".format(BASEURI, endpoint)
-        return requests.get(url, auth=(USERNAME, PASSWORD))
+        return self.registry.http_session.get(url, auth=(USERNAME, PASSWORD), **kwargs)
@@ -1,11 +1,11 @@
 from clarity_ext.service.dilution.service import DilutionService
 from clarity_ext import UnitConversion
-from clarity_ext.repository import ClarityRepository, FileRepository
+from clarity_ext.repository import ClarityRepository, FileRepository, FileCache
 from clarity_ext.utils import lazyprop
 from clarity_ext import ClaritySession
 from clarity_ext.service import (ArtifactService, FileService, StepLoggerService, ClarityService,
                                  ProcessService, ValidationService)
-from clarity_ext.repository import StepRepository
+from clarity_ext.repository import StepRepository, ProcessTypeRepository
 from clarity_ext import utils
 from clarity_ext.service.file_service import OSService
 from clarity_ext.mappers.clarity_mapper import ClarityMapper
@@ -70,10 +70,15 @@ class ExtensionContext(object):
         """
         session = ClaritySession.create(step_id)
         clarity_mapper = ClarityMapper()
-        step_repo = StepRepository(session, clarity_mapper)
+        # Process types are cached between runs, except when testing, where all data should come
+        # from the (frozen) request cache:
+        process_type_cache_dir = None if test_mode else utils.user_cache_dir("process-types")
+        step_repo = StepRepository(session, clarity_mapper, ProcessTypeRepository(process_type_cache_dir))
         artifact_service = ArtifactService(step_repo)
         current_user = step_repo.current_user()
-        file_repository = FileRepository(session)
+        # Downloaded files are shared between steps and runs, except when testing:
+        file_cache = None if test_mode else FileCache(utils.user_cache_dir("files"), session.api.baseuri)
+        file_repository = FileRepository(session, cache=file_cache)
         file_service = FileService(artifact_service, file_repository, False, OSService(),
                                    uploaded_to_stdout=uploaded_to_stdout,
                                    disable_commits=disable_commits,
@@ -180,11 +185,15 @@ class ExtensionContext(object):
         """
         return utils.single(self.artifact_service.all_input_containers())
 
-    def local_shared_file(self, clarity_file_handle, mode="r", is_xml=False, is_csv=False, file_name_contains=None):
+    def local_shared_file(self, clarity_file_handle, mode="r", is_xml=False, is_csv=False, file_name_contains=None,
+                          csv_types=None, csv_quoted=False):
         """
         Downloads the file from the current step. The returned file is generally a regular
         file-like object, but can be casted to an xml object or csv by passing in is_xml or is_csv.
 
+        When parsing a csv, csv_types can map column names to functions converting their values,
+        e.g. {"Concentration": float}, and csv_quoted can be set if values may be in double quotes.
+
 
         NOTE: It would make sense to use constants instead of is_xml and is_csv, but since this
         is designed to be used by non-developers, this might be more readable.
@@ -204,7 +213,7 @@ class ExtensionContext(object):
             return self.file_service.parse_xml(f)
         elif is_csv:
             check_file_extension('.csv')
-            return self.file_service.parse_csv(f)
+            return self.file_service.parse_csv(f, types=csv_types, quoted=csv_quoted)
         else:
             return f
 
@@ -3,58 +3,119 @@ import copy
 
 
 class DomainObjectMixin(object):
+    # Allows subclasses to use __slots__. Subclasses that don't define __slots__ get a __dict__ as usual.
+    __slots__ = ()
 
     def __eq__(self, other):
         if isinstance(other, self.__class__):
-            return self._eq_rec(self, other)
+            return self._eq_rec(self, other, set(), 0, None)
         else:
             return False
 
-    def _eq_rec(self, a, b, cache=[]):
+    def equals(self, other, max_depth=None):
+        """
+        Compares the domain objects like ==, but if max_depth is set, only compares the fields of domain
+        objects down to that depth. Deeper domain objects are equal if they are the same object or have the
+        same id. E.g. with max_depth=1, only the fields of the two objects themselves are compared.
+        """
+        if isinstance(other, self.__class__):
+            return self._eq_rec(self, other, set(), 0, max_depth)
+        else:
+            return False
+
+    @staticmethod
+    def _eq_rec(a, b, visited, depth, max_depth):
         """
         Replaces the == operator because of circulating references (e.g. analyte <-> well)
-        Adapted solution taken from
-        http://stackoverflow.com/questions/31415844/using-the-operator-on-circularly-defined-dictionaries
+
+        The ids of each pair of objects that are being or have been compared are kept in `visited`. When a pair
+        is reached again through a cycle, it's considered equal, since the comparison already in progress
+        decides if it is.
         """
-        cache = cache + [a, b]
-        if isinstance(a, DomainObjectMixin):
-            a = a.__dict__
-        if isinstance(b, DomainObjectMixin):
-            b = b.__dict__
-        if not isinstance(a, dict) or not isinstance(b, dict):
+        if a is b:
+            return True
+        if isinstance(a, DomainObjectMixin) and isinstance(b, DomainObjectMixin):
+            if max_depth is not None and depth >= max_depth:
+                return getattr(a, "id", None) is not None and getattr(a, "id", None) == getattr(b, "id", None)
+            compare_children = DomainObjectMixin._eq_dict
+            children = (fields(a), fields(b))
+            depth += 1
+        elif isinstance(a, dict) and isinstance(b, dict):
+            compare_children = DomainObjectMixin._eq_dict
+            children = (a, b)
+        elif isinstance(a, list) and isinstance(b, list):
+            compare_children = DomainObjectMixin._eq_list
+            children = (a, b)
+        elif isinstance(a, DomainObjectMixin) or isinstance(b, DomainObjectMixin):
+            return False
+        else:
             return a == b
 
-        set_keys = set(a.keys())
-        if set_keys != set(b.keys()):
-            return False
+        pair = (id(a), id(b))
+        if pair in visited:
+            return True
+        visited.add(pair)
+        return compare_children(children[0], children[1], visited, depth, max_depth)
 
-        for key in set_keys:
-            if any(a[key] is i for i in cache):
-                continue
-            elif any(b[key] is i for i in cache):
-                continue
-            elif a[key].__class__.__name__ == "MagicMock" and a[key].__class__.__name__ == "MagicMock":
+    @staticmethod
+    def _eq_dict(a, b, visited, depth, max_depth):
+        if len(a) != len(b):
+            return False
+        for key, value in a.iteritems():
+            if key not in b:
+                return False
+            if value.__class__.__name__ == "MagicMock":
                 # TODO: Move this to the tests. The domain objects shouldn't have to directly know about this
                 # filter out mocked fields
                 continue
-            elif not self._eq_rec(a[key], b[key], cache):
+            if not DomainObjectMixin._eq_rec(value, b[key], visited, depth, max_depth):
                 return False
         return True
 
+    @staticmethod
+    def _eq_list(a, b, visited, depth, max_depth):
+        if len(a) != len(b):
+            return False
+        return all(DomainObjectMixin._eq_rec(x, y, visited, depth, max_depth) for x, y in zip(a, b))
+
     def __ne__(self, other):
         return not self.__eq__(other)
 
     def differing_fields(self, other):
         if isinstance(other, self.__class__):
             ret = []
-            for key in self.__dict__:
-                if self.__dict__.get(key, None) != other.__dict__.get(key, None):
+            self_fields = fields(self)
+            other_fields = fields(other)
+            for key in self_fields:
+                if self_fields.get(key, None) != other_fields.get(key, None):
                     ret.append(key)
             return ret
         else:
             return None
 
 
+_slot_names_by_class = dict()
+
+
+def fields(obj):
+    """
+    Returns the attributes of an object as a dictionary. Works both for objects that store their attributes
+    in __dict__ and those that define __slots__.
+    """
+    cls = type(obj)
+    if cls not in _slot_names_by_class:
+        slot_names = list()
+        for klass in cls.__mro__:
+            slots = klass.__dict__.get("__slots__", ())
+            slot_names.extend([slots] if isinstance(slots, basestring) else slots)
+        _slot_names_by_class[cls] = [name for name in slot_names if name not in ("__dict__", "__weakref__")]
+    ret = dict(getattr(obj, "__dict__", {}))
+    for name in _slot_names_by_class[cls]:
+        if hasattr(obj, name):
+            ret[name] = getattr(obj, name)
+    return ret
+
+
 class AssignLogger(DomainObjectMixin):
     def __init__(self, domain_object_mixin):
         self.log = []
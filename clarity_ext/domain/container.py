@@ -1,5 +1,4 @@
 from collections import namedtuple
-from clarity_ext.utils import lazyprop
 from clarity_ext.domain.common import DomainObjectMixin
 from clarity_ext.domain.udf import DomainObjectWithUdfMixin
 from clarity_ext.domain.udf import UdfMapping
@@ -16,6 +15,8 @@ class Well(DomainObjectMixin):
     A better name for that might have been "coordinates" or "index" to avoid a potential confusion, as
     location and position can have the same meaning.
     """
+    # There is one instance per position in every container, so they are kept small
+    __slots__ = ("position", "container", "artifact")
 
     def __init__(self, position, container, artifact=None):
         self.position = position
@@ -38,13 +39,13 @@ class Well(DomainObjectMixin):
 
     @property
     def index_down_first(self):
-        # The position is 1-indexed
-        return (self.position.col - 1) * self.container.size.height + self.position.row
+        # The index is 1-indexed
+        return self.container.positions.index_down_first[self.position]
 
     @property
     def index_right_first(self):
-        # The position is 1-indexed
-        return (self.position.row - 1) * self.container.size.width + self.position.col
+        # The index is 1-indexed
+        return self.container.positions.index_right_first[self.position]
 
 
 class ContainerPosition(namedtuple("ContainerPosition", ["row", "col"])):
@@ -52,7 +53,29 @@ class ContainerPosition(namedtuple("ContainerPosition", ["row", "col"])):
     Defines the position of an item in a container, (zero based)
 
     Default representation is `<row as letter>:<column as number>`, e.g. `A:1`
+
+    Positions are immutable, so there is only one instance for each (row, col). The instances, and the
+    results of parsing representations in `create`, are cached up front for plates up to INTERNED_SIZE.
+    Other positions are added to the caches until they have MAX_CACHED entries.
     """
+    __slots__ = ()
+
+    INTERNED_SIZE = (16, 24)
+    MAX_CACHED = 10000
+
+    _interned = dict()
+    _parsed = dict()
+
+    def __new__(cls, row, col):
+        try:
+            return cls._interned[(row, col)]
+        except KeyError:
+            pass
+        pos = super(ContainerPosition, cls).__new__(cls, row, col)
+        if cls is ContainerPosition and len(cls._interned) < cls.MAX_CACHED:
+            cls._interned[(row, col)] = pos
+        return pos
+
     def __repr__(self):
         return "{}:{}".format(self.row_letter, self.col)
 
@@ -65,6 +88,13 @@ class ContainerPosition(namedtuple("ContainerPosition", ["row", "col"])):
             (<row>, <col>) where both are integers
             (<row>, <col>) where column is a string (e.g. A)
         """
+        parsed = ContainerPosition._parsed
+        try:
+            return parsed[repr]
+        except (KeyError, TypeError):
+            # TypeError: The representation is not hashable, e.g. a list
+            pass
+
         if isinstance(repr, basestring):
             row, col = repr.split(":")
             if row.isalpha():
@@ -76,7 +106,20 @@ class ContainerPosition(namedtuple("ContainerPosition", ["row", "col"])):
             row, col = repr
             if isinstance(row, basestring):
                 row = ContainerPosition.letter_to_index(row)
-        return ContainerPosition(row=row, col=col)
+        ret = ContainerPosition(row=row, col=col)
+        if len(parsed) < ContainerPosition.MAX_CACHED and isinstance(repr, (basestring, tuple)):
+            parsed[repr] = ret
+        return ret
+
+    @staticmethod
+    def _intern(height, width):
+        """Caches the positions in a container of the size and their common representations"""
+        for row in xrange(1, height + 1):
+            letter = ContainerPosition.index_to_letter(row)
+            for col in xrange(1, width + 1):
+                pos = ContainerPosition(row=row, col=col)
+                for repr in ("{}:{}".format(letter, col), "{}:{}".format(row, col), (row, col), (letter, col)):
+                    ContainerPosition._parsed[repr] = pos
 
     @property
     def row_letter(self):
@@ -92,9 +135,43 @@ class ContainerPosition(namedtuple("ContainerPosition", ["row", "col"])):
         return ord(letter.upper()) - 64
 
 
+ContainerPosition._intern(*ContainerPosition.INTERNED_SIZE)
+
+
 class PlateSize(namedtuple("PlateSize", ["height", "width"])):
     """Defines the size of a plate"""
-    pass
+    __slots__ = ()
+
+
+class PositionTable(object):
+    """
+    Lists the positions in a container of a particular size in both traversal orders and maps each position
+    to its 1-indexed linear index in those orders.
+
+    Tables are created once per size and shared by all containers of that size.
+    """
+    _tables_by_size = dict()
+
+    def __init__(self, height, width):
+        self.down_first = [ContainerPosition(row=row, col=col)
+                           for col in xrange(1, width + 1) for row in xrange(1, height + 1)]
+        self.right_first = [ContainerPosition(row=row, col=col)
+                            for row in xrange(1, height + 1) for col in xrange(1, width + 1)]
+        self.index_down_first = {pos: ix + 1 for ix, pos in enumerate(self.down_first)}
+        self.index_right_first = {pos: ix + 1 for ix, pos in enumerate(self.right_first)}
+
+    @classmethod
+    def for_size(cls, size):
+        key = (size.height, size.width)
+        if key not in cls._tables_by_size:
+            cls._tables_by_size[key] = PositionTable(*key)
+        return cls._tables_by_size[key]
+
+    def in_order(self, order):
+        return self.right_first if order == Container.RIGHT_FIRST else self.down_first
+
+    def __contains__(self, position):
+        return position in self.index_down_first
 
 
 class Container(DomainObjectWithUdfMixin):
@@ -116,6 +193,8 @@ class Container(DomainObjectWithUdfMixin):
         """
         self.udf_map = udf_map
         self.mapping = mapping
+        # Wells are created when they are first accessed, so only those that have been used are stored here:
+        self._wells = dict()
         # TODO: using both container_type and container_type_name is temporary
         self.container_type = container_type
         self.id = container_id
@@ -131,16 +210,38 @@ class Container(DomainObjectWithUdfMixin):
             size = self.size_from_container_type(container_type)
         assert size is not None
         self.size = size
-        self._append_iterator = None
+        # The number of artifacts that have been appended, i.e. the index of the next position to append to
+        self._append_ix = 0
         self.append_order = append_order
         self.sort_weight = sort_weight
         self.fixed_slot = None
 
+        # The wells with content in the mapping are created up front, so they are found by `occupied`:
+        if mapping:
+            for key in mapping:
+                well_pos = ContainerPosition.create(key)
+                if well_pos in self.positions:
+                    self._well(well_pos)
+
+    def __copy__(self):
+        """
+        Returns a shallow copy of the container. The copy has wells of its own, holding the same artifacts.
+        """
+        ret = self.__class__.__new__(self.__class__)
+        ret.__dict__.update(self.__dict__)
+        ret._wells = {pos: Well(pos, ret, well.artifact) for pos, well in self._wells.iteritems()}
+        return ret
+
     def append(self, artifact):
         """Adds this artifact to the next free position"""
-        if self._append_iterator is None:
-            self._append_iterator = self._traverse(order=self.append_order)
-        well_pos = next(self._append_iterator)
+        if not self.size:
+            raise ValueError("Not able to traverse the container without a plate size")
+        positions = self.positions.in_order(self.append_order)
+        if self._append_ix >= len(positions):
+            # Full, raised as when the container was traversed with an iterator
+            raise StopIteration()
+        well_pos = positions[self._append_ix]
+        self._append_ix += 1
         self.set_well_update_artifact(well_pos, artifact)
 
     def to_table(self):
@@ -221,33 +322,46 @@ class Container(DomainObjectWithUdfMixin):
         ret.api_resource = resource
         return ret
 
-    @lazyprop
+    @property
+    def positions(self):
+        """The PositionTable for the size of this container"""
+        return PositionTable.for_size(self.size)
+
+    @property
     def wells(self):
-        ret = dict()
-        for row, col in self._traverse():
+        """
+        Returns all wells in the container, as a dictionary from position to Well.
+
+        NOTE: This creates all wells. Use container[position] to get a single well.
+        """
+        for pos in self.positions.down_first:
+            self._well(pos)
+        return self._wells
+
+    def _well(self, well_pos):
+        """Returns the well at the position, creating it the first time it's accessed"""
+        well = self._wells.get(well_pos)
+        if well is None:
+            if well_pos not in self.positions:
+                raise KeyError(
+                    "Well id {} is not available in this container (type={})".format(well_pos, self))
+            row, col = well_pos
             key = "{}:{}".format(row, col)
             content = self.mapping[key] if self.mapping and key in self.mapping else None
-            pos = ContainerPosition(row=row, col=col)
-            ret[(row, col)] = Well(pos, content)
-            ret[(row, col)].container = self
-        return ret
+            well = Well(ContainerPosition(row=row, col=col), self, content)
+            self._wells[well.position] = well
+        return well
 
     def _traverse(self, order=DOWN_FIRST):
         """Traverses the container, visiting wells in a certain order, yielding keys as (row,col) tuples, 1-indexed"""
         if not self.size:
             raise ValueError("Not able to traverse the container without a plate size")
-
-        rows = range(1, self.size.height + 1)
-        cols = range(1, self.size.width + 1)
-        if order == self.RIGHT_FIRST:
-            return ((row, col) for row in rows for col in cols)
-        else:
-            return ((row, col) for col in cols for row in rows)
+        return iter(self.positions.in_order(order))
 
     # Lists the wells in a certain order:
     def enumerate_wells(self, order=DOWN_FIRST):
         for key in self._traverse(order):
-            yield self.wells[key]
+            yield self._well(key)
 
     def list_wells(self, order=DOWN_FIRST):
         return list(self.enumerate_wells(order))
@@ -257,12 +371,9 @@ class Container(DomainObjectWithUdfMixin):
         if not isinstance(well_pos, ContainerPosition):
             well_pos = ContainerPosition.create(well_pos)
 
-        if well_pos not in self.wells:
-            raise KeyError(
-                "Well id {} is not available in this container (type={})".format(well_pos, self))
-
-        self.wells[well_pos].artifact = artifact
-        return self.wells[well_pos]
+        well = self._well(well_pos)
+        well.artifact = artifact
+        return well
 
     def set_well_update_artifact(self, well_pos, artifact=None):
         updated_well = self.set_well(well_pos, artifact)
@@ -274,8 +385,15 @@ class Container(DomainObjectWithUdfMixin):
 
     @property
     def occupied(self):
-        """Returns non-empty wells as a list"""
-        return [well for well in self if well.artifact]
+        """
+        Returns non-empty wells as a list, ordered down first.
+
+        Only the wells that have been created (including those in the mapping) can be occupied, so the other
+        positions are not visited.
+        """
+        index = self.positions.index_down_first
+        return sorted((well for well in self._wells.itervalues() if well.artifact),
+                      key=lambda well: index[well.position])
 
     def __iter__(self):
         return self.enumerate_wells(order=self.DOWN_FIRST)
@@ -284,12 +402,12 @@ class Container(DomainObjectWithUdfMixin):
         self.set_well_update_artifact(key, artifact=value)
 
     def __contains__(self, item):
-        return item in self.wells
+        return item in self.positions
 
     def __getitem__(self, well_pos):
         if not isinstance(well_pos, ContainerPosition):
             well_pos = ContainerPosition.create(well_pos)
-        return self.wells[well_pos]
+        return self._well(well_pos)
 
     def __repr__(self):
         return "Container(id={})".format(self.id)
@@ -1,9 +1,17 @@
 import re
+import threading
 from clarity_ext.domain.common import DomainObjectMixin
 import logging
 
 logger = logging.getLogger(__name__)
 
+_NON_ALPHANUMERIC = re.compile(r"\W+")
+_REPEATED_UNDERSCORES = re.compile("_{2,}")
+
+# Maps UDF names in Clarity to their Python names. The same few UDF names are used by all objects in a step,
+# so the mapping is shared by all UdfMappings in the process.
+_py_name_by_udf_name = dict()
+
 
 # TODO: Ensure that this overrides the equality check too, to take into account the UDF
 # map (since we're not adding the udfs to the object, or add them to the object)
@@ -18,9 +26,9 @@ class DomainObjectWithUdfMixin(DomainObjectMixin):
     def __getattr__(self, key):
         """Getter that supports access to the extra udf_ attributes"""
         if key != "udf_map" and key.startswith("udf_"):
-            if key in self.udf_map:
-                return self.udf_map[key].value
-            else:
+            try:
+                return self.udf_map.get_value(key)
+            except KeyError:
                 raise self._create_udf_exception(key)
         else:
             raise AttributeError(key)
@@ -32,9 +40,9 @@ class DomainObjectWithUdfMixin(DomainObjectMixin):
             # This disables the default behaviour in Python where users can set any attribute to a domain object
             # in this particular case, since it must be by mistake (the user can still set attributes dynamically
             # if they don't start with udf_)
-            if key in self.udf_map:
-                self.udf_map[key].value = value
-            else:
+            try:
+                self.udf_map.set_value(key, value)
+            except KeyError:
                 raise self._create_udf_exception(key)
         else:
             super(DomainObjectWithUdfMixin, self).__setattr__(key, value)
@@ -53,7 +61,7 @@ class DomainObjectWithUdfMixin(DomainObjectMixin):
 
     def is_dirty(self):
         """Returns True if the Artifact was updated since it was originally fetched"""
-        return sum(1 for _ in self.udf_map.enumerate_updated())
+        return self.udf_map.updated_count()
 
     def get_updated_api_resource(self):
         """
@@ -86,6 +94,111 @@ class DomainObjectWithUdfMixin(DomainObjectMixin):
             return new_api_resource
 
 
+class UdfSchema(object):
+    """
+    The UDFs available on a domain object and how their names map to them.
+
+    A schema maps both the names of the UDFs in Clarity and their Python names to slots, the indexes of
+    the values in a UdfMapping. The objects of the same kind in a step, e.g. the outputs of a process type,
+    have the same UDFs, so schemas are immutable and shared between all UdfMappings with the same UDFs.
+    Use `UdfSchema.get` rather than the constructor.
+
+    The shared schemas are kept in a registry of at most MAX_CACHED schemas, after which new schemas are
+    created for each call, but not shared.
+    """
+    MAX_CACHED = 10000
+
+    _schemas_by_keys = dict()
+    _schemas_by_key_set = dict()
+    # Guards the registry and the extended schemas, so only one schema is shared for the same UDFs
+    _lock = threading.Lock()
+
+    def __init__(self, keys):
+        self.keys = tuple(keys)  # The names of the UDFs in Clarity, in slot order
+        self.py_names = set()
+        self._slots_by_name = dict()  # Both Clarity names and Python names
+        for slot, key in enumerate(self.keys):
+            if key in self._slots_by_name:
+                raise ValueError("Key already in dictionary {}".format(key))
+            self._slots_by_name[key] = (slot,)
+            py_name = UdfMapping._automap_name(key)
+            self._slots_by_name[py_name] = self._slots_by_name.get(py_name, ()) + (slot,)
+            self.py_names.add(py_name)
+        self.py_names = frozenset(self.py_names)
+        self._extended_by_key = dict()
+
+    @classmethod
+    def get(cls, keys):
+        """Returns the shared schema for the UDF names, in any order"""
+        key_set = frozenset(keys)
+        schema = cls._schemas_by_key_set.get(key_set)
+        if schema is None:
+            schema = cls.get_ordered(sorted(key_set))
+            with cls._lock:
+                if len(cls._schemas_by_key_set) < cls.MAX_CACHED:
+                    schema = cls._schemas_by_key_set.setdefault(key_set, schema)
+        return schema
+
+    @classmethod
+    def get_ordered(cls, keys):
+        """Returns the shared schema for the UDF names, with slots in the same order as the names"""
+        keys = tuple(keys)
+        schema = cls._schemas_by_keys.get(keys)
+        if schema is None:
+            schema = UdfSchema(keys)
+            with cls._lock:
+                if len(cls._schemas_by_keys) < cls.MAX_CACHED:
+                    schema = cls._schemas_by_keys.setdefault(keys, schema)
+        return schema
+
+    def extended(self, key):
+        """Returns the shared schema that has the slots of this schema followed by a slot for the key"""
+        schema = self._extended_by_key.get(key)
+        if schema is None:
+            schema = UdfSchema.get_ordered(self.keys + (key,))
+            with UdfSchema._lock:
+                if len(self._extended_by_key) < UdfSchema.MAX_CACHED:
+                    schema = self._extended_by_key.setdefault(key, schema)
+        return schema
+
+    def slots(self, name):
+        """Returns the slots that the Clarity or Python name maps to. Raises a KeyError if there are none"""
+        return self._slots_by_name[name]
+
+    def slot(self, name):
+        """
+        Returns the single slot that the name maps to. Raises a KeyError if the name isn't available and
+        UdfMappingNotUniqueException if the name maps to more than one UDF
+        """
+        slots = self._slots_by_name[name]
+        if len(slots) > 1:
+            raise UdfMappingNotUniqueException(name)
+        return slots[0]
+
+    def __contains__(self, name):
+        return name in self._slots_by_name
+
+    def __iter__(self):
+        return iter(self._slots_by_name)
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __reduce__(self):
+        return _get_ordered_udf_schema, (self.keys,)
+
+
+def _get_ordered_udf_schema(keys):
+    # Pickling support, bound methods can't be pickled
+    return UdfSchema.get_ordered(keys)
+
+
+UdfSchema.EMPTY = UdfSchema.get(())
+
+
 class UdfMapping(object):
     """
     Handles mapping between Clarity UDFs and the domain objects.
@@ -96,21 +209,50 @@ class UdfMapping(object):
     if the key does not uniquely map to a Clarity UDF. If that happens, the user
     can instead either rename the UDF in Clarity or refer to the UDF by its original
     name.
+
+    The names of the UDFs are kept in a UdfSchema that's shared with other objects that have the same
+    UDFs, while the mapping itself only holds a list of the values.
     """
     def __init__(self, original_udf_map=None):
         """
         :param original_udf_map: The original key/value mapping in Clarity, may have
         to be extended for some domain objects to contain all available UDFs
         """
-        self.raw_map = dict()  # Mapping from names (both Clarity style and Python style) to UdfInfo
-        self.values = set()  # List of unique values
-        self.py_names = set()  # A list of the python names for the UDFs
+        self.schema = UdfSchema.EMPTY
+        self._values = list()  # The current values, in the slot order of the schema
+        # The original values of the UDFs that have been assigned to since they were added, by slot. Kept up to
+        # date on assignment, so finding updated values doesn't require looking at all of them.
+        self._original_by_slot = dict()
+        # The (raw_map, values) views, created when first used and dropped when UDFs are added
+        self._views = None
         if original_udf_map:
             self.create_from_dict(original_udf_map)
 
     def __eq__(self, other):
         return self.values == other.values
 
+    @property
+    def raw_map(self):
+        """Mapping from names (both Clarity style and Python style) to a list of UdfInfo"""
+        return self._get_views()[0]
+
+    @property
+    def values(self):
+        """The set of all UDFs, as UdfInfo objects"""
+        return self._get_views()[1]
+
+    def _get_views(self):
+        if self._views is None:
+            infos = [UdfInfo.view(self, slot) for slot in xrange(len(self._values))]
+            raw_map = {name: [infos[slot] for slot in self.schema.slots(name)] for name in self.schema}
+            self._views = raw_map, set(infos)
+        return self._views
+
+    @property
+    def py_names(self):
+        """The python names for the UDFs"""
+        return self.schema.py_names
+
     def force(self, key, value):
         """
         In general, users should not add UDFs that are not defined in the UDF map already. In some cases however,
@@ -119,37 +261,43 @@ class UdfMapping(object):
         """
         if key not in self:
             self.add(key, None)
-        self[key].value = value
+        self.set_value(key, value)
 
     def add(self, key, value):
-        if key in self.raw_map:
+        if key in self.schema:
             raise ValueError("Key already in dictionary {}".format(key))
 
-        # We add a mapping directly from the original key to the (wrapped) value:
-        # It should be in a list, since those mapped by pyname will potentially be more
-        # than one:
-        udf_info = UdfInfo(key, value)
-        self.values.add(udf_info)
-        self.raw_map[key] = [udf_info]
+        # The key is added to the schema, which maps both the original key and the py name to the new slot:
+        self.schema = self.schema.extended(key)
+        self._values.append(value)
+        self._views = None
 
-        # Then, we also fetch the py name, and add that to the raw map too
-        py_name = self._automap_name(key)
-        self.raw_map.setdefault(py_name, list())
-        self.raw_map[py_name].append(udf_info)
-        self.py_names.add(py_name)
+    def get_value(self, key):
+        """
+        Returns the value of the UDF, given either its name in Clarity or its Python name.
 
-        # Post: The raw_map will contain a new key that corresponds to the original
-        # UDF. It will also contain a mapping from a python name to that exact same
-        # value, so fetching by either name will lead to the same results.
+        Raises a KeyError if the key is not available and UdfMappingNotUniqueException if it maps
+        to more than one UDF
+        """
+        return self._values[self.schema.slot(key)]
+
+    def set_value(self, key, value):
+        """Sets the value of the UDF, given either its name in Clarity or its Python name"""
+        self._set_slot(self.schema.slot(key), value)
+
+    def _set_slot(self, slot, value):
+        if slot not in self._original_by_slot:
+            self._original_by_slot[slot] = self._values[slot]
+        self._values[slot] = value
 
     def __getitem__(self, key):
         return self.unwrap(key)
 
     def __setitem__(self, key, value):
-        self.unwrap(key).value = value
+        self.set_value(key, value)
 
     def udf_name_in_lims_ui(self, py_udf):
-        return self.raw_map[py_udf][0].key
+        return self.schema.keys[self.schema.slots(py_udf)[0]]
 
     def unwrap(self, key):
         """
@@ -158,24 +306,38 @@ class UdfMapping(object):
 
         Raises a KeyError if the key is not available in the UDF map
         """
-        udf_info = self.raw_map[key]
-        if len(udf_info) > 1:
-            raise UdfMappingNotUniqueException(key)
-        return udf_info[0]
+        return UdfInfo.view(self, self.schema.slot(key))
 
     def create_from_dict(self, udf_dict):
-        for key, value in udf_dict.items():
-            self.add(key, value)
+        if self._values:
+            for key, value in udf_dict.items():
+                self.add(key, value)
+            return
+        # All domain objects are created this way, so rather than adding one UDF at a time, the shared
+        # schema for all of the UDFs is looked up once:
+        udf_dict = dict(udf_dict.items())
+        self.schema = UdfSchema.get(udf_dict)
+        self._values = [udf_dict[key] for key in self.schema.keys]
+        self._views = None
 
     def usage(self):
         """Returns a string showing which UDFs are available, using Python names"""
         return ", ".join(self.py_names)
 
     def enumerate_updated(self):
-        return (value for value in self.values if value.is_dirty())
+        return (UdfInfo.view(self, slot) for slot, original in self._original_by_slot.items()
+                if self._values[slot] != original)
+
+    def updated_count(self):
+        """Returns the number of UDFs that have been updated since they were added"""
+        return sum(1 for _ in self.enumerate_updated())
+
+    def snapshot(self):
+        """Returns the names and current values of the UDFs, which can be compared to a later snapshot"""
+        return self.schema, tuple(self._values)
 
     def __contains__(self, item):
-        return item in self.raw_map
+        return item in self.schema
 
     @staticmethod
     def _automap_name(original_udf_name):
@@ -189,12 +351,17 @@ class UdfMapping(object):
           'Fragment Lower (bp)' => 'udf_fragment_lower_bp'
           '% Total' => 'udf_total'
         """
+        try:
+            return _py_name_by_udf_name[original_udf_name]
+        except KeyError:
+            pass
         new_name = original_udf_name.lower().replace(" ", "_")
         # Get rid of all non-alphanumeric characters
-        new_name = re.sub("\W+", "", new_name)
+        new_name = _NON_ALPHANUMERIC.sub("", new_name)
         new_name = "udf_{}".format(new_name)
         # Now ensure that we don't have repeated undercores:
-        new_name = re.sub("_{2,}", "_", new_name)
+        new_name = _REPEATED_UNDERSCORES.sub("_", new_name)
+        _py_name_by_udf_name[original_udf_name] = new_name
         return new_name
 
     @staticmethod
@@ -216,18 +383,51 @@ class UdfMapping(object):
 class UdfInfo(object):
     """
     Represents a Udf. Contains the original value as well as the current value.
+
+    The UdfInfos of a UdfMapping are views of one of its values, created with `view`, so assigning to the value
+    updates the mapping. A UdfInfo created with the constructor has a mapping of its own.
     """
+    __slots__ = ("_mapping", "_slot")
+
     def __init__(self, key, value):
-        self.key = key
-        self.value = value
-        self._original_value = self.value
+        mapping = UdfMapping()
+        mapping.add(key, value)
+        self._mapping = mapping
+        self._slot = 0
+
+    @classmethod
+    def view(cls, mapping, slot):
+        """Returns the UdfInfo for a slot in the mapping"""
+        ret = cls.__new__(cls)
+        ret._mapping = mapping
+        ret._slot = slot
+        return ret
+
+    @property
+    def key(self):
+        return self._mapping.schema.keys[self._slot]
+
+    @property
+    def value(self):
+        return self._mapping._values[self._slot]
+
+    @value.setter
+    def value(self, value):
+        self._mapping._set_slot(self._slot, value)
+
+    @property
+    def _original_value(self):
+        return self._mapping._original_by_slot.get(self._slot, self.value)
 
     def is_dirty(self):
         """Returns True if the value has changed since the object was created"""
         return self.value != self._original_value
 
     def __eq__(self, other):
-        return self.__dict__ == other.__dict__
+        return (self.key, self.value, self._original_value) == (other.key, other.value, other._original_value)
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
 
     def __hash__(self):
         return hash(self.__repr__())
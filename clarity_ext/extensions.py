@@ -252,14 +252,17 @@ class ExtensionService(object):
         old_dir = os.getcwd()
         os.chdir(path)
         self.logger.info("Executing at {}".format(path))
+        # Connections are shared within a run only, since e.g. the request cache depends on the run path
+        ClaritySession.registry.reset()
         context = ExtensionContext.create(pid, test_mode=test_mode,
                                           disable_commits=disable_context_commit,
                                           uploaded_to_stdout=artifacts_to_stdout)
         instance = extension(context)
         try:
             if issubclass(extension, DriverFileExtension):
-                context.file_service.upload(instance.shared_file(), instance.filename(), instance.to_string(),
-                                            instance.file_prefix())
+                with context.file_service.open_upload(instance.shared_file(), instance.filename(),
+                                                      instance.file_prefix()) as f:
+                    instance.write(f)
             elif issubclass(extension, GeneralExtension):
                 instance.execute()
             else:
@@ -569,10 +572,23 @@ class DriverFileExtension(GeneralExtension):
     def newline(self):
         return "\n"
 
-    def to_string(self):
+    def write(self, stream):
+        """Writes the content to a stream one line at a time, with the same content as to_string"""
         content = self.content()
         # Support that the content can be a list of strings. This supports an older version of the DriverFileExtension
         # which was not template based. Consider removing this usage of the DriverFileExtension.
+        if isinstance(content, basestring):
+            content = [content]
+        for ix, line in enumerate(content):
+            if ix > 0:
+                stream.write(self.newline())
+            if isinstance(line, unicode):
+                line = line.encode("utf-8")
+            stream.write(line)
+
+    def to_string(self):
+        """Returns the content as one string. Kept for backwards compatibility, the file is uploaded with write"""
+        content = self.content()
         if isinstance(content, basestring):
             return content
         else:
@@ -29,6 +29,11 @@ class ClarityMapper(object):
         # TODO: Currently just caching analytes 
         self.domain_map = dict()
 
+        # Samples and projects are shared between many artifacts in a step. They are created only once,
+        # indexed by the ID in the LIMS:
+        self.sample_map = dict()
+        self.project_map = dict()
+
         # TODO: The container_repo used here could be reused per the lifetime of the mapper instead, and not
         # passed around.
         self.create_resource_by_type = {
@@ -47,12 +52,26 @@ class ClarityMapper(object):
         return self.map[domain_object]
 
     def sample_create_object(self, resource):
-        project = Project(resource.project.name) if resource.project else None
+        """
+        Creates a Sample from the rest resource. There will be only one sample domain object
+        for each sample id, even if the sample is in several artifacts.
+        """
+        if resource.id in self.sample_map:
+            return self.sample_map[resource.id]
+        project = self.project_create_object(resource.project) if resource.project else None
         udf_map = UdfMapping(resource.udf)
         sample = Sample(resource.id, resource.name, project, udf_map)
         self._after_object_created(sample, resource)
+        self.sample_map[resource.id] = sample
         return sample
 
+    def project_create_object(self, resource):
+        if resource.id in self.project_map:
+            return self.project_map[resource.id]
+        project = Project(resource.name)
+        self.project_map[resource.id] = project
+        return project
+
     def create_resource(self, domain_object):
         return self.create_resource_by_type[type(domain_object)](domain_object)
 
@@ -105,8 +124,8 @@ class ClarityMapper(object):
 
         well = self.well_create_object(resource, container_repo, is_input)
 
-        # TODO: sample should be put in a lazy property, and all samples in a step should be
-        # loaded in one batch
+        # NOTE: The step repository loads all samples in the step in one batch before
+        # creating the domain objects
         samples = [self.sample_create_object(
             sample) for sample in resource.samples]
 
@@ -132,7 +151,6 @@ class ClarityMapper(object):
         pass
 
     def well_create_object(self, resource, container_repo, is_source):
-        # TODO: Batch call
         try:
             container = container_repo.get_container(resource.location[0], is_source)
         except AttributeError:
@@ -144,7 +162,7 @@ class ClarityMapper(object):
 
         well = None
         if container and pos:
-            well = container.wells[pos]
+            well = container[pos]
 
         return well
 
@@ -166,8 +184,8 @@ class ClarityMapper(object):
 
         well = self.well_create_object(resource, container_repo, is_input)
 
-        # TODO: sample should be put in a lazy property, and all samples in a step should be
-        # loaded in one batch
+        # NOTE: The step repository loads all samples in the step in one batch before
+        # creating the domain objects
         samples = [self.sample_create_object(
             sample) for sample in resource.samples]
         ret = ResultFile(api_resource=resource, is_input=is_input,
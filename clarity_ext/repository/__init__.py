@@ -1,4 +1,6 @@
 from step_repository import StepRepository
 from file_repository import FileRepository
+from file_cache import FileCache
 from container_repository import ContainerRepository
-from clarity_repository import ClarityRepository
\ No newline at end of file
+from clarity_repository import ClarityRepository, BatchUpdateException
+from process_type_repository import ProcessTypeRepository
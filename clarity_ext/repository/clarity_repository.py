@@ -1,3 +1,65 @@
+import logging
+from collections import OrderedDict
+
+
 class ClarityRepository(object):
+    # The default number of resources sent in each batch update
+    BATCH_SIZE = 100
+
+    def __init__(self, logger=None):
+        self.logger = logger or logging.getLogger(__name__)
+
     def update(self, resource):
         resource.put()
+
+    def update_batch(self, resources, batch_size=BATCH_SIZE):
+        """
+        Updates the resources, with one call to the batch endpoint of the LIMS per `batch_size` resources
+        of the same type (e.g. samples or containers).
+
+        If a batch fails, its resources are updated one at a time, so the failures can be reported per
+        resource. After all resources have been tried, a BatchUpdateException is raised if any of them failed.
+
+        A resource that's passed in more than once (by URI) is only updated once, with the last
+        object passed in for it, since the batch endpoint doesn't accept the same resource twice.
+        """
+        resources_by_uri = OrderedDict()
+        for resource in resources:
+            resources_by_uri[resource.uri] = resource
+
+        resources_by_type = dict()
+        for resource in resources_by_uri.values():
+            resources_by_type.setdefault(type(resource), list()).append(resource)
+
+        failures = list()
+        for resource_type, resources_of_type in sorted(resources_by_type.items(), key=lambda t: t[0].__name__):
+            for ix in xrange(0, len(resources_of_type), batch_size):
+                batch = resources_of_type[ix:ix + batch_size]
+                try:
+                    batch[0].lims.put_batch(batch)
+                except Exception as e:
+                    self.logger.warning("Batch update of {} {} resources failed ({}), updating them one at a "
+                                        "time".format(len(batch), resource_type.__name__, e))
+                    failures.extend(self._update_each(batch))
+
+        if failures:
+            raise BatchUpdateException(failures)
+
+    def _update_each(self, resources):
+        """Updates the resources one at a time, returning a list of (resource, exception) for those that failed"""
+        failures = list()
+        for resource in resources:
+            try:
+                self.update(resource)
+            except Exception as e:
+                self.logger.error("Not able to update {}: {}".format(resource, e))
+                failures.append((resource, e))
+        return failures
+
+
+class BatchUpdateException(Exception):
+    """Raised when one or more resources could not be updated. `failures` is a list of (resource, exception)"""
+    def __init__(self, failures):
+        super(BatchUpdateException, self).__init__("Not able to update {} resource(s): {}".format(
+            len(failures), ", ".join("{} ({})".format(resource, e) for resource, e in failures)))
+        self.failures = failures
@@ -0,0 +1,153 @@
+import os
+import shutil
+import hashlib
+import logging
+import tempfile
+from clarity_ext import utils
+
+
+class FileCache(object):
+    """
+    A content addressed cache of files downloaded from the LIMS, shared between steps and runs.
+
+    Files in Clarity are never changed after they have been uploaded, a new upload always gets a new
+    file id. Each file id therefore maps to an entry in `ids/<server>/` that holds the digest, size and
+    content location of the file, while the content is stored once in `blobs/<digest>`, no matter how many
+    file ids refer to it. Entries are only used if the content location (or checksum) given by the caller,
+    as reported by the server, matches the entry.
+
+    When the size of all blobs exceeds `max_bytes`, the least recently used blobs are removed, along with
+    the entries that refer to them.
+    """
+    DEFAULT_MAX_BYTES = 1024 ** 3
+
+    def __init__(self, cache_dir, server, max_bytes=DEFAULT_MAX_BYTES, logger=None):
+        """
+        :param cache_dir: The directory the files are cached in
+        :param server: The base URI of the LIMS the files are downloaded from. File ids are only
+                       unique within one server, so each server has its own entries.
+        :param max_bytes: The disk budget of the cache
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.logger = logger or logging.getLogger(__name__)
+        self.ids_dir = os.path.join(cache_dir, "ids", hashlib.sha1(server).hexdigest())
+        self.blobs_dir = os.path.join(cache_dir, "blobs")
+
+    def get(self, file_id, local_path, content_location=None, checksum=None):
+        """
+        Copies the cached content of the file to local_path.
+
+        The cached copy is only used if it was cached with the same content location or has the checksum.
+
+        :param content_location: The content location of the file, as reported by the server
+        :param checksum: The expected md5 digest of the content
+        :return: The digest of the content, or None if the file is not in the cache.
+        """
+        entry = self._read_entry(file_id)
+        if entry is None:
+            return None
+        digest, size, cached_location = entry
+        if not ((content_location is not None and content_location == cached_location) or
+                (checksum is not None and checksum.lower() == digest)):
+            self.logger.info("Cached copy of file {} doesn't match the server, ignoring it".format(file_id))
+            return None
+        blob_path = os.path.join(self.blobs_dir, digest)
+        try:
+            if os.path.getsize(blob_path) != size:
+                self.logger.warning("Cached file {} has an unexpected size, ignoring it".format(blob_path))
+                return None
+            shutil.copyfile(blob_path, local_path)
+            # Touching the blob marks it as recently used
+            os.utime(blob_path, None)
+        except (IOError, OSError):
+            return None
+        self.logger.info("Using cached copy of file {}".format(file_id))
+        return digest
+
+    def put(self, file_id, path, digest, content_location=None):
+        """Adds the file at path, with content having the digest, to the cache"""
+        try:
+            size = os.path.getsize(path)
+            if size > self.max_bytes:
+                return
+            for directory in (self.ids_dir, self.blobs_dir):
+                if not os.path.exists(directory):
+                    os.makedirs(directory)
+            blob_path = os.path.join(self.blobs_dir, digest)
+            if not os.path.exists(blob_path):
+                # Write to a temporary file first, so other processes never read a half written blob
+                fd, temp_path = tempfile.mkstemp(dir=self.blobs_dir)
+                os.close(fd)
+                shutil.copyfile(path, temp_path)
+                utils.replace_file(temp_path, blob_path)
+            fd, temp_path = tempfile.mkstemp(dir=self.ids_dir)
+            with os.fdopen(fd, "w") as f:
+                f.write("{} {} {}".format(digest, size, content_location or ""))
+            utils.replace_file(temp_path, self._entry_path(file_id))
+        except (IOError, OSError) as e:
+            self.logger.warning("Not able to cache file {}: {}".format(file_id, e))
+            return
+        self.evict()
+
+    def evict(self):
+        """
+        Removes the least recently used blobs until the cache is within its disk budget, and the entries
+        of all servers that refer to them
+        """
+        try:
+            blobs = list()
+            for name in os.listdir(self.blobs_dir):
+                path = os.path.join(self.blobs_dir, name)
+                stat = os.stat(path)
+                blobs.append((stat.st_mtime, stat.st_size, path))
+        except OSError:
+            return
+        total = sum(size for _, size, _ in blobs)
+        if total <= self.max_bytes:
+            return
+        for _, size, path in sorted(blobs):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+        self._remove_dangling_entries()
+
+    def _remove_dangling_entries(self):
+        """Removes the entries, of all servers, that refer to blobs that are no longer in the cache"""
+        try:
+            digests = set(os.listdir(self.blobs_dir))
+            entry_dirs = [os.path.join(self.cache_dir, "ids", name)
+                          for name in os.listdir(os.path.join(self.cache_dir, "ids"))]
+        except OSError:
+            return
+        for entry_dir in entry_dirs:
+            try:
+                file_ids = os.listdir(entry_dir)
+            except OSError:
+                continue
+            for file_id in file_ids:
+                path = os.path.join(entry_dir, file_id)
+                try:
+                    with open(path) as f:
+                        digest = f.read().split(" ", 1)[0]
+                    # An empty entry is still being written by `put`
+                    if digest and digest not in digests:
+                        os.remove(path)
+                except (IOError, OSError):
+                    pass
+
+    def _entry_path(self, file_id):
+        return os.path.join(self.ids_dir, file_id)
+
+    def _read_entry(self, file_id):
+        try:
+            with open(self._entry_path(file_id)) as f:
+                values = f.read().split()
+            digest, size = values[0], int(values[1])
+            return digest, size, values[2] if len(values) > 2 else None
+        except (IOError, OSError, ValueError):
+            return None
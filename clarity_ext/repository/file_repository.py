@@ -1,3 +1,9 @@
+import os
+import hashlib
+import logging
+from clarity_ext import utils
+
+
 class FileRepository:
     """
     Handles remote and local file access.
@@ -5,15 +11,64 @@ class FileRepository:
     TODO: Merge with "OSService"
     """
 
-    def __init__(self, session):
+    # Remote files are streamed to disk in chunks of this size, so memory usage doesn't depend on the file size
+    DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+    def __init__(self, session, chunk_size=DOWNLOAD_CHUNK_SIZE, cache=None, logger=None):
+        """
+        :param cache: A FileCache that downloaded files are served from on repeated reads. If None,
+                      files are always downloaded.
+        """
         self.session = session
+        self.chunk_size = chunk_size
+        self.cache = cache
+        self.logger = logger or logging.getLogger(__name__)
+
+    def copy_remote_file(self, remote_file_id, local_path, checksum=None, checksum_algorithm="md5",
+                         content_location=None):
+        """
+        Downloads the remote file to local_path.
 
-    def copy_remote_file(self, remote_file_id, local_path):
+        The file is first written to a temporary file next to local_path, which is moved in place when
+        the download has completed, so an interrupted download never leaves a partial file at local_path.
+
+        :param checksum: If provided, the hex digest of the downloaded content must equal this value
+        :param checksum_algorithm: Any algorithm supported by hashlib
+        :param content_location: The content location of the file resource on the server. A cached copy is
+                                 only used if it has the same content location or the checksum.
+        :return: The hex digest of the downloaded content
+        """
+        if self.cache is not None and checksum_algorithm == "md5":
+            digest = self.cache.get(remote_file_id, local_path, content_location, checksum)
+            if digest is not None:
+                return digest
+
+        self.logger.info("Downloading file {}".format(remote_file_id))
         # TODO: implemented in the genologics pip package?
-        response = self.session.get("files/{}/download".format(remote_file_id))
-        with open(local_path, 'wb') as fd:
-            for chunk in response.iter_content():
-                fd.write(chunk)
+        response = self.session.get("files/{}/download".format(remote_file_id), stream=True)
+        temp_path = local_path + ".part"
+        digest = hashlib.new(checksum_algorithm)
+        try:
+            response.raise_for_status()
+            with open(temp_path, 'wb') as fd:
+                for chunk in response.iter_content(chunk_size=self.chunk_size):
+                    fd.write(chunk)
+                    digest.update(chunk)
+        except Exception:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        finally:
+            response.close()
+
+        if checksum is not None and digest.hexdigest() != checksum.lower():
+            os.remove(temp_path)
+            raise DownloadChecksumError("The {} checksum of file {} was {}, expected {}".format(
+                checksum_algorithm, remote_file_id, digest.hexdigest(), checksum))
+        utils.replace_file(temp_path, local_path)
+        if self.cache is not None and checksum_algorithm == "md5":
+            self.cache.put(remote_file_id, local_path, digest.hexdigest(), content_location)
+        return digest.hexdigest()
 
     def open_local_file(self, local_path, mode):
         """
@@ -23,3 +78,7 @@ class FileRepository:
         Services will always use this way of opening files.
         """
         return open(local_path, mode)
+
+
+class DownloadChecksumError(Exception):
+    pass
@@ -0,0 +1,86 @@
+import os
+import time
+import hashlib
+import logging
+import tempfile
+import cPickle as pickle
+from clarity_ext import utils
+from clarity_ext.domain import ProcessType
+
+
+class ProcessTypeRepository(object):
+    """
+    Fetches `ProcessType` domain objects, i.e. the metadata of a step, such as the UDFs defined on its outputs.
+
+    Process types only change when the LIMS is reconfigured, so they are cached in memory for the lifetime
+    of the repository and, if a cache directory is provided, on disk between runs. Entries on disk are
+    used for `ttl` seconds after they were written, after that they are fetched from the LIMS again.
+    """
+    DEFAULT_TTL = 60 * 60
+
+    # Increase this if the layout of the cached objects changes, so old entries are not used
+    CACHE_VERSION = 1
+
+    def __init__(self, cache_dir=None, ttl=DEFAULT_TTL, logger=None):
+        """
+        :param cache_dir: The directory process types are cached in between runs. If None, they are
+                          only cached in memory.
+        :param ttl: Number of seconds an entry on disk is used before it's fetched again.
+        """
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.logger = logger or logging.getLogger(__name__)
+        self._process_types_by_uri = dict()
+
+    def get_process_type(self, resource):
+        """Returns the process type, given the process type's REST resource"""
+        uri = resource.uri
+        if uri not in self._process_types_by_uri:
+            process_type = self._load(uri)
+            if process_type is None:
+                resource.get()
+                process_type = ProcessType.create_from_resource(resource)
+                self._save(uri, process_type)
+            self._process_types_by_uri[uri] = process_type
+        return self._process_types_by_uri[uri]
+
+    def _cache_path(self, uri):
+        key = hashlib.sha1("{}:{}".format(self.CACHE_VERSION, uri)).hexdigest()
+        return os.path.join(self.cache_dir, "{}.pickle".format(key))
+
+    def _load(self, uri):
+        if self.cache_dir is None:
+            return None
+        path = self._cache_path(uri)
+        try:
+            if time.time() - os.path.getmtime(path) > self.ttl:
+                return None
+            with open(path, "rb") as f:
+                process_type = pickle.load(f)
+        except (IOError, OSError):
+            return None
+        except Exception as e:
+            # A corrupt entry should never stop the extension, it will be replaced by a fresh one
+            self.logger.warning("Not able to read cached process type {}: {}".format(path, e))
+            return None
+        self.logger.debug("Using cached process type for {}".format(uri))
+        return process_type
+
+    def _save(self, uri, process_type):
+        if self.cache_dir is None:
+            return
+        temp_path = None
+        try:
+            if not os.path.exists(self.cache_dir):
+                os.makedirs(self.cache_dir)
+            # Write to a temporary file first, so other processes never read a half written entry
+            fd, temp_path = tempfile.mkstemp(dir=self.cache_dir)
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump(process_type, f, pickle.HIGHEST_PROTOCOL)
+            utils.replace_file(temp_path, self._cache_path(uri))
+        except (IOError, OSError, pickle.PicklingError, TypeError) as e:
+            # TypeError is raised for objects that can't be pickled at all, e.g. ones wrapping a file
+            self.logger.warning("Not able to cache process type {}: {}".format(uri, e))
+        finally:
+            if temp_path is not None and os.path.exists(temp_path):
+                os.remove(temp_path)
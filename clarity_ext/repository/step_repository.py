@@ -3,8 +3,8 @@ from clarity_ext.domain.analyte import Analyte
 from clarity_ext.domain.result_file import ResultFile
 from clarity_ext.domain.shared_result_file import SharedResultFile
 from clarity_ext.repository.container_repository import ContainerRepository
+from clarity_ext.repository.process_type_repository import ProcessTypeRepository
 from clarity_ext.domain.user import User
-from clarity_ext.domain import ProcessType
 
 
 class StepRepository(object):
@@ -17,15 +17,44 @@ class StepRepository(object):
     to do that.
     """
 
-    def __init__(self, session, clarity_mapper):
+    def __init__(self, session, clarity_mapper, process_type_repository=None):
         """
         Creates a new StepRepository
 
         :param session: A session object for connecting to Clarity
+        :param process_type_repository: Provides the process type of the step. If None, process types
+                                        are only cached in memory.
         """
         self.session = session
         self.clarity_mapper = clarity_mapper
+        self.process_type_repository = process_type_repository or ProcessTypeRepository()
+        self._input_output_maps = None
 
+    def prefetch(self):
+        """
+        Fetches the REST resources all_artifacts wraps, without wrapping them in domain objects.
+
+        This only talks to the API, so it can be called for several steps concurrently, while the
+        wrapping, which goes through the shared clarity_mapper, is done on one thread in all_artifacts.
+        """
+        if self._input_output_maps is None:
+            input_output_maps = self.session.current_step.api_resource.input_output_maps
+            artifact_keys = set()
+            for input, output in input_output_maps:
+                artifact_keys.add(input["uri"])
+                artifact_keys.add(output["uri"])
+            artifacts = self.session.api.get_batch(artifact_keys)
+            artifacts_by_uri = {artifact.uri: artifact for artifact in artifacts}
+            for input, output in input_output_maps:
+                input['uri'] = artifacts_by_uri[input['uri'].uri]
+                output['uri'] = artifacts_by_uri[output['uri'].uri]
+
+            # Wrapping the artifacts requires their containers and container types, load them up front
+            # rather than having each of them fetched lazily while wrapping:
+            self._prefetch_containers(artifacts)
+            self._prefetch_samples(artifacts)
+            self._input_output_maps = input_output_maps
+        return self._input_output_maps
 
     def all_artifacts(self):
         """
@@ -44,16 +73,9 @@ class StepRepository(object):
         for simplified use of the API. If optimal performance is required, use the underlying REST API
         instead.
         """
-        input_output_maps = self.session.current_step.api_resource.input_output_maps
-        artifact_keys = set()
-        for input, output in input_output_maps:
-            artifact_keys.add(input["uri"])
-            artifact_keys.add(output["uri"])
-        artifacts = self.session.api.get_batch(artifact_keys)
-        artifacts_by_uri = {artifact.uri: artifact for artifact in artifacts}
-        for input, output in input_output_maps:
-            input['uri'] = artifacts_by_uri[input['uri'].uri]
-            output['uri'] = artifacts_by_uri[output['uri'].uri]
+        input_output_maps = self.prefetch()
+        # The resources are only reused once, later calls fetch them again:
+        self._input_output_maps = None
 
         # Artifacts do not contain UDFs that have not been given a value. Since the domain objects returned
         # must know all UDFs available, we fetch them here:
@@ -61,7 +83,6 @@ class StepRepository(object):
         process_type = self.get_process_type()
 
         ret = []
-        # TODO: Ensure that the container repo fetches all containers in one batch call:
 
         # In the case of pools, we might have the same output artifact repeated more than once, ensure
         # that we create only one artifact domain object in this case:
@@ -77,6 +98,46 @@ class StepRepository(object):
             outputs_by_id[output.id] = output
         return ret
 
+    def _prefetch_containers(self, artifacts):
+        """
+        Fetches all containers the artifacts are located in with one batch call. Container types
+        can't be fetched in batch through the API, so each distinct type is fetched once.
+
+        The underlying library caches the resources, so later lookups through the artifacts
+        will not result in further requests.
+        """
+        containers_by_uri = dict()
+        for artifact in artifacts:
+            try:
+                container = artifact.location[0]
+            except (AttributeError, TypeError):
+                # Not all artifacts have a location, e.g. shared result files
+                continue
+            if container is not None:
+                containers_by_uri[container.uri] = container
+        containers = self.session.api.get_batch(containers_by_uri.values())
+
+        container_types_by_uri = {container.type.uri: container.type for container in containers}
+        for container_type in container_types_by_uri.values():
+            container_type.get()
+
+    def _prefetch_samples(self, artifacts):
+        """
+        Fetches all samples in the artifacts with one batch call. The same sample will usually be found
+        in several artifacts, e.g. both in the input and the output, but it's only requested once.
+
+        Projects can't be fetched in batch through the API, so each distinct project is fetched once.
+        """
+        samples_by_id = dict()
+        for artifact in artifacts:
+            for sample in artifact.samples:
+                samples_by_id[sample.id] = sample
+        samples = self.session.api.get_batch(samples_by_id.values())
+
+        projects_by_uri = {sample.project.uri: sample.project for sample in samples if sample.project}
+        for project in projects_by_uri.values():
+            project.get()
+
     def _wrap_input_output(self, input_info, output_info, container_repo, process_type):
 
         # Create a map of all containers, so we can fill in it while building
@@ -155,8 +216,7 @@ class StepRepository(object):
 
     def get_process_type(self):
         """Returns the process type of the current process"""
-        self.session.current_step.api_resource.type.get()
-        return ProcessType.create_from_resource(self.session.current_step.api_resource.type)
+        return self.process_type_repository.get_process_type(self.session.current_step.api_resource.type)
 
     def get_process(self):
         """Returns the currently running process (step)"""
@@ -4,6 +4,7 @@ from clarity_ext.domain import *
 from clarity_ext.domain.shared_result_file import SharedResultFile
 from clarity_ext.repository import StepRepository
 from clarity_ext import ClaritySession
+from clarity_ext import utils
 
 
 class ArtifactService:
@@ -12,107 +13,125 @@ class ArtifactService:
 
     Artifacts are fetched through the step_repository, provided in the constructor.
 
-    All objects fetched from the step repository are cached.
+    All objects fetched from the step repository are cached, until `refresh` is called.
     """
 
-    def __init__(self, step_repository, logger=None):
+    # The number of parent steps that are fetched concurrently
+    PARENT_STEP_WORKERS = 1
+
+    def __init__(self, step_repository, logger=None, parent_step_workers=PARENT_STEP_WORKERS):
+        """
+        :param step_repository: The repository artifacts are fetched from
+        :param parent_step_workers: The number of parent steps that are fetched concurrently when
+                                    fetching parent input artifacts. Set to 1 to fetch them one at a time.
+        """
         self.step_repository = step_repository
         self.logger = logger or logging.getLogger(__name__)
+        self.parent_step_workers = parent_step_workers
         self._artifacts = None
+        self._artifact_index = None
         self._parent_input_artifacts_by_sample_id = None
+        # The number of times the artifacts have been fetched from the repository, for debugging
+        self.repository_hits = 0
 
     def all_artifacts(self):
+        """
+        Returns all input/output pairs in the step.
+
+        They are fetched from the repository once and all accessors are served from this snapshot,
+        call `refresh` to fetch them again.
+        """
         # NOTE: The underlying REST library does also do some caching, but since this library wraps
         # objects, some benefit may be achieved by caching on this level too.
-        if not self._artifacts:
+        if self._artifacts is None:
             self._artifacts = self.step_repository.all_artifacts()
+            self.repository_hits += 1
+            self.logger.debug("Fetched all artifacts in the step from the repository ({} fetch(es) so far)"
+                              .format(self.repository_hits))
         return self._artifacts
 
+    def refresh(self):
+        """Drops the snapshot of the step's artifacts, so they are fetched from the repository on next access"""
+        self._artifacts = None
+        self._artifact_index = None
+        self._parent_input_artifacts_by_sample_id = None
+
+    @property
+    def _index(self):
+        if self._artifact_index is None:
+            self._artifact_index = ArtifactIndex(self.all_artifacts())
+        return self._artifact_index
+
     def shared_files(self):
         """
         Returns all shared files for the current step
         """
-        outputs = (outp for inp, outp in self.all_artifacts())
-        shared_files = (
-            outp for outp in outputs if isinstance(outp, SharedResultFile))
-        ret = list(utils.unique(shared_files, lambda f: f.id))
+        ret = self._index.of_type(ArtifactIndex.OUTPUT, SharedResultFile)
         assert len(ret) == 0 or isinstance(ret[0], SharedResultFile)
         return ret
 
+    def shared_files_by_name(self, name):
+        """Returns all shared files for the current step that have the name, e.g. "Step Log" """
+        return list(self._index.shared_files_by_name.get(name, []))
+
     def all_aliquot_pairs(self):
         """
         Returns all aliquots in a step as an artifact pair (input/output)
         """
-        pairs = self.step_repository.all_artifacts()
-        aliquots_only = filter(lambda pair: isinstance(pair[0], Aliquot) and
-                               isinstance(pair[1], Aliquot), pairs)
-        return [ArtifactPair(i, o) for i, o in aliquots_only]
+        return self._index.pairs_of_type(Aliquot)
 
     def all_analyte_pairs(self):
         """
         Returns all analytes in a step as an artifact pair (input/output)
         """
-        pairs = self.all_artifacts()
-        analytes_only = filter(lambda pair: isinstance(pair[0], Analyte) and
-                               isinstance(pair[1], Analyte), pairs)
-        return [ArtifactPair(i, o) for i, o in analytes_only]
+        return self._index.pairs_of_type(Analyte)
 
     def all_input_artifacts(self):
         """Returns a unique list of input artifacts"""
-        return utils.unique(self._filter_artifact(True, Artifact), lambda item: item.id)
+        return list(self._index.artifacts[ArtifactIndex.INPUT])
 
     def all_output_artifacts(self):
         """Returns a unique list of output artifacts"""
-        return utils.unique(self._filter_artifact(False, Artifact), lambda item: item.id)
+        return list(self._index.artifacts[ArtifactIndex.OUTPUT])
+
+    def input_artifact_by_id(self, artifact_id):
+        return self._index.by_id[ArtifactIndex.INPUT][artifact_id]
 
-    def _filter_artifact(self, input, type):
-        # Fetches all input analytes in the step, unique
-        pair_index = 0 if input else 1
-        for pair in self.all_artifacts():
-            if isinstance(pair[pair_index], type):
-                yield pair[pair_index]
+    def output_artifact_by_id(self, artifact_id):
+        return self._index.by_id[ArtifactIndex.OUTPUT][artifact_id]
 
     def all_input_analytes(self):
         """Returns a unique list of input analytes"""
-        return filter(lambda x: isinstance(x, Analyte), self.all_input_artifacts())
+        return self._index.of_type(ArtifactIndex.INPUT, Analyte)
 
     def all_output_analytes(self):
         """Returns a unique list of output analytes"""
-        return filter(lambda x: isinstance(x, Analyte), self.all_output_artifacts())
+        return self._index.of_type(ArtifactIndex.OUTPUT, Analyte)
 
     def all_output_containers(self):
-        containers_non_unique = (artifact.container
-                                 for artifact in self.all_output_artifacts()
-                                 if isinstance(artifact, Aliquot) and artifact.container is not None)
-        containers = utils.unique(
-            containers_non_unique, lambda item: item.id)
-        return list(containers)
+        return list(self._index.containers[ArtifactIndex.OUTPUT])
 
     def all_input_containers(self):
-        artifacts_having_container = (artifact.container
-                                      for artifact in self.all_input_artifacts()
-                                      if artifact.container is not None)
-        containers = utils.unique(
-            artifacts_having_container, lambda item: item.id)
-        return list(containers)
+        return list(self._index.containers[ArtifactIndex.INPUT])
+
+    def input_artifacts_in_container(self, container_id):
+        """Returns all input artifacts in the container with the id"""
+        return list(self._index.by_container_id[ArtifactIndex.INPUT].get(container_id, []))
+
+    def output_artifacts_in_container(self, container_id):
+        """Returns all output artifacts in the container with the id"""
+        return list(self._index.by_container_id[ArtifactIndex.OUTPUT].get(container_id, []))
 
     def all_output_files(self):
-        outputs = (outp for inp, outp in self.all_artifacts())
-        files = (outp for outp in outputs
-                 if outp.output_type == Artifact.OUTPUT_TYPE_RESULT_FILE)
-        ret = list(utils.unique(files, lambda f: f.id))
-        return ret
+        return self._index.of_output_type(Artifact.OUTPUT_TYPE_RESULT_FILE)
 
     def output_file_by_id(self, file_id):
-        ret = utils.single(
-            [outp for outp in self.all_output_files() if outp.id == file_id])
-        return ret
+        output = self._index.by_id[ArtifactIndex.OUTPUT].get(file_id)
+        is_file = output is not None and output.output_type == Artifact.OUTPUT_TYPE_RESULT_FILE
+        return utils.single([output] if is_file else [])
 
     def all_shared_result_files(self):
-        outputs = (outp for inp, outp in self.all_artifacts())
-        files = (outp for outp in outputs
-                 if outp.output_type == Artifact.OUTPUT_TYPE_SHARED_RESULT_FILE)
-        ret = list(utils.unique(files, lambda f: f.id))
+        ret = self._index.of_output_type(Artifact.OUTPUT_TYPE_SHARED_RESULT_FILE)
         assert len(ret) == 0 or isinstance(ret[0], ResultFile)
         return ret
 
@@ -132,19 +151,38 @@ class ArtifactService:
 
         This method will fetch all of the input artifacts based on all of your output artifacts in one call
         and index them by their respective process id.
+
+        If `parent_step_workers` is larger than 1, the REST resources of the parent steps are fetched
+        concurrently, sharing the connection of the current step. They are always wrapped in domain objects
+        on the calling thread, since the mapper is shared between the steps.
+
+        Inputs that don't have a parent process (i.e. original samples) have no parent input artifacts.
         """
         # We will need the input artifacts from the previous step
         parent_processes = set([artifact.input.parent_process for artifact in self.all_output_artifacts()])
+        if None in parent_processes:
+            self.logger.info("Some inputs have no parent process, they have no parent input artifacts")
+            parent_processes.remove(None)
+        parent_processes = sorted(parent_processes, key=lambda process: process.id)
 
-        for process in parent_processes:
-            # This might seem roundabout, but for simplicity, we create another artifact service for
-            # fetching the parent items:
-            parent_step_repo = StepRepository(ClaritySession.create(process.id),
-                                              self.step_repository.clarity_mapper)
-            parent_artifact_service = ArtifactService(parent_step_repo)
-            for input in parent_artifact_service.all_input_artifacts():
+        parent_services = [self._step_artifact_service(process) for process in parent_processes]
+        utils.map_concurrently(lambda service: service.step_repository.prefetch(), parent_services,
+                               self.parent_step_workers)
+        for service in parent_services:
+            for input in service.all_input_artifacts():
                 yield input
 
+    def _step_artifact_service(self, process):
+        """
+        Creates an artifact service for another step. This might seem roundabout, but for simplicity, we
+        create another artifact service for fetching the items. It shares the connection, mapper and
+        process type cache with the current step.
+        """
+        session = ClaritySession(self.step_repository.session.api, process.id)
+        step_repo = StepRepository(session, self.step_repository.clarity_mapper,
+                                   self.step_repository.process_type_repository)
+        return ArtifactService(step_repo, self.logger)
+
     def get_parent_input_artifact(self, sample):
         """
         Given a sample in some artifact, returns a list of parent artifacts for that sample. This should usually
@@ -165,14 +203,79 @@ class ArtifactService:
         """
         Returns all individual output `ResultFile`s. These are generated "per input".
         """
-        return [output for _, output in self.all_artifacts()
+        return [output for _, output in self._index.pairs
                 if output.generation_type == output.PER_INPUT]
 
     def get_all_analyte_pairs_from_process(self, process):
         """
         Returns all analyte_pairs from a specific process
         """
-        process_step_repo = StepRepository(ClaritySession.create(process.id),
-                                          self.step_repository.clarity_mapper)
-        parent_artifact_service = ArtifactService(process_step_repo)
-        return parent_artifact_service.all_analyte_pairs()
+        return self._step_artifact_service(process).all_analyte_pairs()
+
+
+class ArtifactIndex(object):
+    """
+    Indexes the input/output pairs of a step, so the ArtifactService can answer lookups by id, type,
+    container and shared file name without scanning all pairs.
+
+    Artifacts are indexed per role (input or output), since an artifact can be both. Lookups by type
+    are built the first time they are requested.
+    """
+    INPUT = 0
+    OUTPUT = 1
+
+    def __init__(self, pairs):
+        self.pairs = list(pairs)
+        self.artifacts = (list(), list())
+        self.by_id = (dict(), dict())
+        self.containers = (list(), list())
+        self.by_container_id = (defaultdict(list), defaultdict(list))
+        self.shared_files_by_name = defaultdict(list)
+        self._by_type = dict()
+        self._pairs_by_type = dict()
+        self._by_output_type = dict()
+
+        container_ids = (set(), set())
+        for pair in self.pairs:
+            for role in (self.INPUT, self.OUTPUT):
+                artifact = pair[role]
+                if artifact.id in self.by_id[role]:
+                    continue
+                self.by_id[role][artifact.id] = artifact
+                self.artifacts[role].append(artifact)
+                self._index_container(role, artifact, container_ids)
+                if role == self.OUTPUT and isinstance(artifact, SharedResultFile):
+                    self.shared_files_by_name[artifact.name].append(artifact)
+
+    def _index_container(self, role, artifact, container_ids):
+        container = getattr(artifact, "container", None)
+        if container is None:
+            return
+        self.by_container_id[role][container.id].append(artifact)
+        # Only aliquots are considered to be in an output container
+        if container.id not in container_ids[role] and (role == self.INPUT or isinstance(artifact, Aliquot)):
+            container_ids[role].add(container.id)
+            self.containers[role].append(container)
+
+    def of_type(self, role, artifact_type):
+        """Returns the unique artifacts in the role that are instances of artifact_type"""
+        key = (role, artifact_type)
+        if key not in self._by_type:
+            self._by_type[key] = [artifact for artifact in self.artifacts[role]
+                                  if isinstance(artifact, artifact_type)]
+        return list(self._by_type[key])
+
+    def pairs_of_type(self, artifact_type):
+        """Returns the pairs where both the input and output are instances of artifact_type"""
+        if artifact_type not in self._pairs_by_type:
+            self._pairs_by_type[artifact_type] = [
+                ArtifactPair(i, o) for i, o in self.pairs
+                if isinstance(i, artifact_type) and isinstance(o, artifact_type)]
+        return list(self._pairs_by_type[artifact_type])
+
+    def of_output_type(self, output_type):
+        """Returns the unique outputs with the output type, one of the Artifact.OUTPUT_TYPE_* values"""
+        if output_type not in self._by_output_type:
+            self._by_output_type[output_type] = [artifact for artifact in self.artifacts[self.OUTPUT]
+                                                 if getattr(artifact, "output_type", None) == output_type]
+        return list(self._by_output_type[output_type])
@@ -1,5 +1,6 @@
 import logging
 from clarity_ext.domain import Container, Artifact, Sample
+from clarity_ext.repository import ClarityRepository
 
 
 class ClarityService(object):
@@ -9,11 +10,16 @@ class ClarityService(object):
     Note that artifacts (e.g. Analytes) are still handled in the ArtifactService
     """
 
-    def __init__(self, clarity_repo, step_repo, clarity_mapper, logger=None):
+    def __init__(self, clarity_repo, step_repo, clarity_mapper, logger=None,
+                 batch_size=ClarityRepository.BATCH_SIZE):
+        """
+        :param batch_size: The maximum number of containers or samples sent in one batch update
+        """
         self.logger = logger or logging.getLogger(__name__)
         self.clarity_repository = clarity_repo
         self.step_repository = step_repo
         self.clarity_mapper = clarity_mapper
+        self.batch_size = batch_size
 
     def update(self, domain_objects, ignore_commit=False):
         """Updates the domain object"""
@@ -28,8 +34,10 @@ class ClarityService(object):
             else:
                 raise NotImplementedError("No update method available for {}".format(type(item)))
 
-        for domain_object in other_domain_objects:
-            self.update_single(domain_object, ignore_commit)
+        resources = [resource for resource in map(self._updated_resource, other_domain_objects)
+                     if resource is not None]
+        if resources and not ignore_commit:
+            self.clarity_repository.update_batch(resources, self.batch_size)
 
         if ignore_commit:
             # TODO: When ignoring commits, the changes that would have been committed are not logged anymore
@@ -62,6 +70,12 @@ class ClarityService(object):
         return ret
 
     def update_single(self, domain_object, ignore_commit):
+        api_resource = self._updated_resource(domain_object)
+        if api_resource is not None and not ignore_commit:
+            self.clarity_repository.update(api_resource)
+
+    def _updated_resource(self, domain_object):
+        """Returns the api resource of the container or sample with changes applied, or None if it's unchanged"""
         # TODO: This is a quick-fix to support changing container names
         if isinstance(domain_object, Container):
             api_resource = domain_object.api_resource
@@ -73,12 +87,10 @@ class ClarityService(object):
                 for udf in domain_object.udf_map.values:
                     if udf.key not in api_resource.udf or api_resource.udf[udf.key] != udf.value:
                         api_resource.udf[udf.key] = udf.value
-                if not ignore_commit:
-                    self.clarity_repository.update(api_resource)
+                return api_resource
+            return None
         elif isinstance(domain_object, Sample):
             # TODO: Update in a consistent way. LIMS-1057
-            api_resource = self.clarity_mapper.create_resource(domain_object)
-            if not ignore_commit:
-                self.clarity_repository.update(api_resource)
+            return self.clarity_mapper.create_resource(domain_object)
         else:
             raise NotImplementedError("The type '{}' isn't implemented".format(type(domain_object)))
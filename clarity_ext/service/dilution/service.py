@@ -1,11 +1,13 @@
 import abc
 import copy
 import logging
-from itertools import groupby
+import threading
+import weakref
 from itertools import izip_longest
 import collections
 from collections import namedtuple
-from clarity_ext.service.file_service import Csv
+from cStringIO import StringIO
+from clarity_ext.service.file_service import Csv, CsvWriter, FileService
 from clarity_ext.domain.validation import ValidationException, ValidationType, ValidationResults, UsageError
 from clarity_ext import utils
 from clarity_ext.domain import Container, Well
@@ -16,7 +18,9 @@ class DilutionService(object):
         self.validation_service = validation_service
         self.logger = logger or logging.getLogger(__name__)
 
-    def create_session(self, robots, dilution_settings, context, transfer_handler_types, transfer_batch_handler_types):
+    def create_session(self, robots, dilution_settings, context, transfer_handler_types, transfer_batch_handler_types,
+                       batch_mode=False, robot_workers=1, debug_routes=False, incremental=False,
+                       stream_driver_files=False):
         """
         Creates a DilutionSession based on the settings. Call evaluate to validate the entire session
         with a particular batch of objects.
@@ -24,7 +28,10 @@ class DilutionService(object):
         A DilutionSession contains several TransferBatch objects that need to be evaluated together
         """
         session = DilutionSession(self, robots, dilution_settings, self.validation_service,
-                                  context, transfer_handler_types, transfer_batch_handler_types)
+                                  context, transfer_handler_types, transfer_batch_handler_types,
+                                  batch_mode=batch_mode, robot_workers=robot_workers,
+                                  debug_routes=debug_routes, incremental=incremental,
+                                  stream_driver_files=stream_driver_files)
         return session
 
 
@@ -35,7 +42,9 @@ class DilutionSession(object):
     """
 
     def __init__(self, dilution_service, robots, dilution_settings,
-                 validation_service, context, transfer_handler_types, transfer_batch_handler_types, logger=None):
+                 validation_service, context, transfer_handler_types, transfer_batch_handler_types, logger=None,
+                 batch_mode=False, robot_workers=1, debug_routes=False, incremental=False,
+                 stream_driver_files=False):
         """
         Initializes a DilutionSession object for the robots.
 
@@ -47,6 +56,18 @@ class DilutionSession(object):
         :param transfer_handler_types: A list of handlers that transform the SingleTransfer objects
         :param transfer_batch_handler_types: A list of handlers that execute on a transfer batch as a whole
         :param logger: An optional logger. If None, the default logger is used.
+        :param batch_mode: If True, all transfers for a robot are passed through one handler at a time, so handlers
+                           that set `supports_batch` can calculate the values for all of them in one call.
+        :param robot_workers: The number of robots evaluated concurrently, each on a thread of its own. Set to 1
+                              to evaluate them one at a time on the calling thread. Handlers are created per robot,
+                              but handlers that share state between robots should not be run concurrently.
+        :param debug_routes: If True, each node in a transfer route after the first gets its own copy of the
+                             transfer, so the route shows the values after each handler. Otherwise nodes share
+                             the virtual transfer until a handler splits it.
+        :param incremental: If True, routes and batches are kept between calls to evaluate, and only the routes of
+                            pairs that have changed since are evaluated again. See `invalidate`.
+        :param stream_driver_files: If True, the driver files are DriverFile objects that map the transfers to
+                                    rows while being written, rather than Csv objects holding all rows.
         """
         self.dilution_service = dilution_service
         self.robot_settings_by_name = {robot.name: robot for robot in robots}
@@ -61,14 +82,47 @@ class DilutionSession(object):
         self.logger = logger or logging.getLogger(__name__)
         self.transfer_handler_types = transfer_handler_types
         self.transfer_batch_handler_types = transfer_batch_handler_types
+        # Temporary containers by original container id. Used when the session isn't evaluating a robot,
+        # robots use their own, see `temporary_containers_by_robot`.
         self.map_temporary_container_by_original = dict()
+        self.temporary_containers_by_robot = dict()  # The temporary containers of each robot, by robot name
+        self._evaluating = threading.local()  # The temporary containers of the robot evaluated on this thread
+        self.batch_mode = batch_mode
+        self.robot_workers = robot_workers
+        self.debug_routes = debug_routes
+        self.incremental = incremental
+        self.stream_driver_files = stream_driver_files
+        self.evaluation_caches = dict()  # The RobotEvaluationCache by robot name, in incremental mode
 
     def evaluate(self, pairs):
-        """Refreshes all calculations for all registered robots and runs registered handlers and validators."""
+        """
+        Refreshes all calculations for all registered robots and runs registered handlers and validators.
+
+        The robots are evaluated concurrently if robot_workers allows it. Each robot splits transfers into
+        temporary containers of its own, so the result doesn't depend on the order the robots are evaluated in.
+        Validation results are pushed to the validation service afterwards, ordered by robot name.
+        """
         self.pairs = pairs
         self.transfer_batches_by_robot = dict()
-        for robot_settings in self.robot_settings_by_name.values():
-            self.transfer_batches_by_robot[robot_settings.name] = self.create_batches(self.pairs, robot_settings)
+        robots = [self.robot_settings_by_name[name] for name in sorted(self.robot_settings_by_name)]
+
+        def evaluate_robot(robot_settings):
+            transfer_batches = self.evaluate_batches(pairs, robot_settings)
+            self.create_driver_files(robot_settings, transfer_batches)
+            return transfer_batches
+        evaluated = utils.map_concurrently(evaluate_robot, robots, self.robot_workers)
+        for robot_settings, transfer_batches in zip(robots, evaluated):
+            self.push_validation_results(transfer_batches)
+            self.transfer_batches_by_robot[robot_settings.name] = transfer_batches
+
+    def invalidate(self):
+        """
+        Forgets all routes and batches kept in incremental mode, so they are all evaluated again.
+
+        Changes to the pairs' artifacts, samples and wells and to the attributes of the settings are found by
+        evaluate, but changes to anything else a handler uses require calling this first.
+        """
+        self.evaluation_caches = dict()
 
     def init_handlers(self, transfer_handler_types, batch_handler_types,
                       dilution_settings, robot_settings, virtual_batch):
@@ -93,14 +147,21 @@ class DilutionSession(object):
         return transfer_handlers, batch_handlers
 
     def get_temporary_container(self, target_container, prefix):
-        """Returns the temporary container that should be used rather than the original one, when splitting transfers"""
-        if target_container.id not in self.map_temporary_container_by_original:
+        """
+        Returns the temporary container that should be used rather than the original one, when splitting transfers
+
+        While a robot is evaluated, its own temporary containers are used.
+        """
+        temporary_containers = getattr(self._evaluating, "temporary_containers", None)
+        if temporary_containers is None:
+            temporary_containers = self.map_temporary_container_by_original
+        if target_container.id not in temporary_containers:
             temp_container = Container.create_from_container(target_container)
-            temp_container.id = "{}{}".format(prefix, len(self.map_temporary_container_by_original) + 1)
+            temp_container.id = "{}{}".format(prefix, len(temporary_containers) + 1)
             temp_container.name = temp_container.id
             temp_container.is_temporary = True
-            self.map_temporary_container_by_original[target_container.id] = temp_container
-        return self.map_temporary_container_by_original[target_container.id]
+            temporary_containers[target_container.id] = temp_container
+        return temporary_containers[target_container.id]
 
     def _evaluate_transfer_route_rec(self, current, transfer_handlers, handler_ix):
         if handler_ix == len(transfer_handlers):
@@ -121,14 +182,80 @@ class DilutionSession(object):
             self._evaluate_transfer_route_rec(child, transfer_handlers, handler_ix + 1)
 
     def evaluate_transfer_route(self, transfer, transfer_handlers):
-        """Runs the calculation handlers on the transfer, returning a list of one or two transfers (if split)"""
+        """
+        Runs the calculation handlers on the transfer, returning a list of one or two transfers (if split)
+
+        The route starts with the transfer itself, so the handlers update the transfer in the virtual batch
+        until it's split (or, if debug_routes is set, until the first handler has run).
+        """
         root = TransferRouteNode(transfer)
         self._evaluate_transfer_route_rec(root, transfer_handlers, 0)
         return TransferRoute(root, transfer_handlers)
 
+    def evaluate_transfer_routes(self, transfers, transfer_handlers):
+        """
+        Runs the calculation handlers on all transfers, one handler at a time, returning one route per transfer.
+
+        Handlers that support batches get all transfers that reach them in one call to `run_batch`, others are
+        run on each transfer in turn. As with `evaluate_transfer_route`, a transfer is not passed on to the next
+        handler if it has validation errors.
+        """
+        roots = [TransferRouteNode(transfer) for transfer in transfers]
+        current = roots
+        for handler_ix, handler in enumerate(transfer_handlers):
+            if len(current) == 0:
+                break
+            self.logger.debug("Evaluating handler #{}, {} on {} transfers".format(handler_ix, handler, len(current)))
+            if handler.supports_batch:
+                children_per_node = handler.run_batch(current)
+            else:
+                children_per_node = [handler.run(node) for node in current]
+            evaluated = list()
+            for node, children in zip(current, children_per_node):
+                node.children = children
+                if len(node.transfer.validation_results.errors) > 0:
+                    continue
+                evaluated.extend(children)
+            current = evaluated
+        return [TransferRoute(root, transfer_handlers) for root in roots]
+
     def create_batches(self, pairs, robot_settings):
+        """Evaluates the transfer batches for one robot, pushes validation results and creates the driver files"""
+        transfer_batches = self.evaluate_batches(pairs, robot_settings)
+        self.push_validation_results(transfer_batches)
+        self.create_driver_files(robot_settings, transfer_batches)
+        return transfer_batches
+
+    def evaluate_batches(self, pairs, robot_settings):
+        """
+        Runs all handlers for one robot, returning the transfer batches. Doesn't push validation results.
+
+        Transfers are split into the robot's own temporary containers, so robots can be evaluated on
+        different threads.
+        """
+        try:
+            return self._evaluate_batches(pairs, robot_settings)
+        finally:
+            self._evaluating.temporary_containers = None
+
+    def _evaluate_batches(self, pairs, robot_settings):
         # Create the original "virtual" transfers. These represent what we would like to happen:
-        transfers = self.create_transfers_from_pairs(pairs)
+        if self.incremental:
+            cache = self.evaluation_caches.setdefault(robot_settings.name, RobotEvaluationCache())
+            cache.update_settings(self.dilution_settings, robot_settings)
+            transfers, changed = cache.transfers_from_pairs(pairs, self.create_transfers_from_pairs)
+            if changed and cache.has_split_routes():
+                # The wells the earlier routes took in the temporary containers are still occupied, so all routes
+                # are evaluated again in new temporary containers
+                cache.reset()
+                transfers, changed = cache.transfers_from_pairs(pairs, self.create_transfers_from_pairs)
+            temporary_containers = cache.temporary_containers
+        else:
+            cache = None
+            transfers = changed = self.create_transfers_from_pairs(pairs)
+            temporary_containers = dict()
+        self.temporary_containers_by_robot[robot_settings.name] = temporary_containers
+        self._evaluating.temporary_containers = temporary_containers
         virtual_batch = VirtualTransferBatch(transfers)
 
         # Now evaluate the actual transfer route we need to take for each transfer in order
@@ -139,12 +266,17 @@ class DilutionSession(object):
                                                                self.dilution_settings,
                                                                robot_settings,
                                                                virtual_batch)
-        transfer_routes = dict()
-
         # Evaluate the transfers, i.e. execute all handlers. This does not group them into transfer batches yet
-        for transfer in transfers:
-            route = self.evaluate_transfer_route(transfer, transfer_handlers)
-            transfer_routes[transfer] = route
+        if self.batch_mode:
+            routes = self.evaluate_transfer_routes(changed, transfer_handlers)
+        else:
+            routes = [self.evaluate_transfer_route(transfer, transfer_handlers) for transfer in changed]
+        if cache is not None:
+            transfer_routes, affected_batches = cache.update_routes(changed, routes)
+            self.logger.debug("Evaluated {} of {} transfer routes for {}".format(
+                len(changed), len(transfers), robot_settings.name))
+        else:
+            transfer_routes = dict(zip(transfers, routes))
 
         if self.logger.isEnabledFor(logging.DEBUG):
             self.logger.debug("Calculated transfer routes:")
@@ -153,8 +285,8 @@ class DilutionSession(object):
 
         # NOTE: the transfer_routes dictionary now contains detailed information about which route each transfer
         # takes so it should be easy to debug. We could add this to the metadata as extra info, but currently
-        # it's just disposed of (but can be used for debugging). Note also that it intentionally takes copies of
-        # each transfer.
+        # it's just disposed of (but can be used for debugging). Note also that it only takes copies of
+        # each transfer if debug_routes is set.
 
         # Now group all evaluated transfers together into a batch
         transfer_by_batch = dict()
@@ -165,50 +297,80 @@ class DilutionSession(object):
                 transfer_by_batch[transfer.batch].append(transfer)
 
         transfer_batches = TransferBatchCollection(robot_settings.transfer_batch_sort_key)
+        evaluated_batches = TransferBatchCollection(robot_settings.transfer_batch_sort_key)
         for key in transfer_by_batch:
+            if cache is not None and key not in affected_batches and key in cache.batches_by_name:
+                # None of the transfers in the batch have changed, so it's used as it is, including its driver file
+                transfer_batches.append(cache.batches_by_name[key])
+                continue
             depth = 0 if key == "default" else 1  # TODO Used?
             is_temporary = key != "default"  # and this?
-            transfer_batches.append(TransferBatch(transfer_by_batch[key], depth, is_temporary, key))
+            batch = TransferBatch(transfer_by_batch[key], depth, is_temporary, key)
+            transfer_batches.append(batch)
+            evaluated_batches.append(batch)
 
         # Run transfer_batch handlers, these might for example validate an entire batch
         for batch_handler in batch_handlers:
-            for batch in transfer_batches:
+            for batch in evaluated_batches:
                 batch_handler.handle_batch(batch)
+        if batch_handlers:
+            # The handlers may have changed the batches or their transfers
+            transfer_batches.invalidate()
+
+        if cache is not None:
+            cache.update_batches(transfer_batches)
+        return transfer_batches
 
-        # Push all validation results over to the validation_service
+    def push_validation_results(self, transfer_batches):
+        """Pushes all validation results over to the validation_service"""
         for batch in transfer_batches:
             self.validation_service.handle_validation(batch.validation_results)
 
+    def create_driver_files(self, robot_settings, transfer_batches):
+        """
+        Creates the driver file for each of the robot's transfer batches that doesn't have one yet, or has one that
+        was created when the batch had another index
+        """
         for ix, transfer_batch in enumerate(transfer_batches):
+            if transfer_batch.driver_file is not None and transfer_batch.driver_file_index == ix:
+                continue
+            transfer_batch.driver_file_index = ix
+            file_name = robot_settings.get_filename(transfer_batch, self.context, ix)
+            sorted_transfers = sorted(transfer_batch.transfers, key=self.dilution_settings.sort_strategy)
+            if self.stream_driver_files:
+                transfer_batch.driver_file = DriverFile(file_name, robot_settings, sorted_transfers)
+                continue
             # Evaluate CSVs:
             csv = Csv(delim=robot_settings.delimiter, newline=robot_settings.newline)
-            csv.file_name = robot_settings.get_filename(transfer_batch, self.context, ix)
+            csv.file_name = file_name
             csv.set_header(robot_settings.header)
-            sorted_transfers = sorted(transfer_batch.transfers, key=self.dilution_settings.sort_strategy)
             for transfer in sorted_transfers:
                 if robot_settings.include_transfer_in_output(transfer):
                     csv.append(robot_settings.map_transfer_to_row(transfer), transfer)
             transfer_batch.driver_file = csv
 
-        return transfer_batches
-
-    def create_transfers_from_pairs(self, pairs):
+    def create_transfers_from_pairs(self, pairs, containers=None):
         """
         Creates the original transfer nodes in the route from the pairs
 
         Runs only the pre-validation (which usually ensures that the user provided conc/vol)
 
         Does not validate the transfers in another way or run the calculations.
+
+        :param containers: Copies of the original containers by id, from an earlier call. Containers that
+                           aren't in it are copied and added to it.
         """
         # NOTE: The original containers are copied, so the containers in the transfer batch can be modified at will
-        containers = dict()
+        if containers is None:
+            containers = dict()
         # First ensure that we've taken copies of the original containers, since we want to be able to move
         # the artifacts to different wells, it's cleaner to do that in a copied container:
         original_containers = set()
         original_containers.update([pair.input_artifact.container for pair in pairs])
         original_containers.update([pair.output_artifact.container for pair in pairs])
         for original_container in original_containers:
-            containers[original_container.id] = copy.copy(original_container)
+            if original_container.id not in containers:
+                containers[original_container.id] = copy.copy(original_container)
 
         def create_well(artifact):
             return Well(artifact.well.position,
@@ -256,6 +418,8 @@ class DilutionSession(object):
     @staticmethod
     def group_transfers_by_target_analyte(transfer_batches):
         """Returns transfers grouped by target analyte"""
+        if isinstance(transfer_batches, TransferBatchCollection):
+            return transfer_batches.transfers_by_target_analyte()
         ret = dict()
         for transfer_batch in transfer_batches:
             for transfer in transfer_batch.transfers:
@@ -458,12 +622,8 @@ class VirtualTransferBatch(object):
 
     @staticmethod
     def transfers_by_output(transfers):
-        def group():
-            def group_key(transfer):
-                return transfer.target_location.artifact.id
-            s = sorted(transfers, key=group_key)
-            return {k: list(t) for k, t in groupby(s, key=group_key)}
-        return {k: VirtualTransfer(t) for k, t in group().items()}
+        grouped = group_by(transfers, lambda transfer: transfer.target_location.artifact.id)
+        return {k: VirtualTransfer(t) for k, t in grouped.items()}
 
 
 class VirtualTransfer(object):
@@ -488,6 +648,14 @@ class VirtualTransfer(object):
         return "{} => {}".format(inputs, output)
 
 
+def group_by(items, key):
+    """Groups the items by key in one pass, keeping the order of the items within each group"""
+    ret = dict()
+    for item in items:
+        ret.setdefault(key(item), list()).append(item)
+    return ret
+
+
 # Represents source conc/vol, target conc/vol as one unit. TODO: Better name
 DilutionMeasurements = namedtuple('DilutionMeasurements', ['source_conc', 'source_vol', 'target_conc', 'target_vol'])
 UpdateInfo = namedtuple("UpdateInfo", ['target_conc', 'target_vol', 'source_vol_delta'])
@@ -660,10 +828,16 @@ class TransferValidationException(ValidationException):
 class TransferBatch(object):
     """
     Encapsulates a list of SingleTransfer objects. Used to generate robot driver files.
+
+    The grouping of the transfers is cached. It's recreated after `append`, but call `invalidate` after changing
+    the batch or its transfers in any other way.
     """
 
     def __init__(self, transfers, depth=0, is_temporary=False, name=None):
         self._container_to_container_slot = dict()
+        # The collections the batch is in, their sort order and groupings are invalidated with the batch
+        self._collections = weakref.WeakSet()
+        self.avoided_sorts = 0  # The number of times a cached grouping was used rather than grouping again
         self.depth = depth
         self.is_temporary = is_temporary  # temp dilution, no plate will actually be saved.
         self.validation_results = list()
@@ -672,6 +846,10 @@ class TransferBatch(object):
         self._transfers_by_output_dict = None
         # Target containers may be adjusted with number samples according to when batch is performed
         self.target_containers = None
+        # The Csv for the batch, set when the DilutionSession creates driver files
+        self.driver_file = None
+        # The index of the batch the driver file was created for, since the file name may depend on it
+        self.driver_file_index = None
         # Set to True if the transfer batch was split
         self.split = False
 
@@ -681,6 +859,16 @@ class TransferBatch(object):
         """
         self._transfers.append(transfer)
         transfer.transfer_batch = self
+        self.invalidate()
+
+    def invalidate(self):
+        """
+        Forgets the cached grouping of the transfers, and the sort order and groupings of the collections
+        the batch is in
+        """
+        self._transfers_by_output_dict = None
+        for collection in self._collections:
+            collection.forget()
 
     def _set_transfers(self, transfers):
         self._transfers_by_output_dict = None
@@ -703,15 +891,14 @@ class TransferBatch(object):
         """Returns the transfers in the batch grouped by the artifact in the target well"""
         if self._transfers_by_output_dict is None:
             self._transfers_by_output_dict = self._transfers_by_output()
-        return self._transfers_by_output_dict
+        else:
+            self.avoided_sorts += 1
+        return dict(self._transfers_by_output_dict)
 
     def _transfers_by_output(self):
-        def group_key(transfer):
-            # TODO: Use the artifact rather than the id
-            return transfer.target_location.artifact.id
-
-        transfers = sorted(self.transfers, key=group_key)
-        return {k: list(t) for k, t in groupby(transfers, key=group_key)}
+        # TODO: Use the artifact rather than the id
+        return {key: tuple(transfers) for key, transfers in
+                group_by(self.transfers, lambda transfer: transfer.target_location.artifact.id).items()}
 
     # TODO: site-specific
     def _include_in_container_mappings(self, transfer):
@@ -757,12 +944,8 @@ class TransferBatch(object):
 
     def virtual_transfers(self):
         """Returns a list of all pools. Makes sense if this batch represents pooled samples"""
-        unique_output = set()
-        for transfer in self.transfers:
-            unique_output.add(transfer.target_location.artifact.id)
-
-        for artifact_id in unique_output:
-            yield VirtualTransfer(self.transfers_by_output[artifact_id])
+        for transfers in self.transfers_by_output.values():
+            yield VirtualTransfer(transfers)
 
     def __iter__(self):
         return iter(self.transfers)
@@ -779,7 +962,7 @@ class LocationGroup(object):
         values = set()
         for location in self.locations:
             for sample in location.artifact.samples:
-                if udf in sample.udf_map.raw_map:
+                if udf in sample.udf_map:
                     values.add(sample.udf_map[udf].value)
         if len(values) == 0:
             return None
@@ -790,18 +973,53 @@ class TransferBatchCollection(object):
     """
     Encapsulates the list of TransferBatch object that go together, i.e. as the result of splitting a
     TransferBatch.
+
+    The sort order and the grouping of the transfers are cached. They are recreated after `append` and when
+    a batch is invalidated, but call `invalidate` after changing the batches or their transfers in any other way.
     """
 
     def __init__(self, sort_key, *args):
         self._batches = list()
-        self._batches.extend(args)
         self.sort_key = sort_key
+        # Sorted and grouped results, by name. Each is kept with the sort key it was created with.
+        self._memo = dict()
+        self.sorts = 0
+        self.avoided_sorts = 0
+        for batch in args:
+            self.append(batch)
 
     def append(self, obj):
         self._batches.append(obj)
+        obj._collections.add(self)
+        self.forget()
+
+    def invalidate(self):
+        """Forgets the cached sort order and groupings, of the collection and of each of its batches"""
+        for batch in self._batches:
+            batch.invalidate()
+        self.forget()
+
+    def forget(self):
+        """Forgets the cached sort order and grouping of the collection"""
+        self._memo = dict()
+
+    def _memoized(self, name, key, fn):
+        if name in self._memo and self._memo[name][0] == key:
+            self.avoided_sorts += 1
+        else:
+            self.sorts += 1
+            self._memo[name] = (key, fn())
+        return self._memo[name][1]
 
     def __iter__(self):
-        return iter(sorted(self._batches, key=self.sort_key))
+        return iter(self._memoized("sorted", self.sort_key, lambda: sorted(self._batches, key=self.sort_key)))
+
+    def transfers_by_target_analyte(self):
+        """Returns the transfers in all batches grouped by the artifact in their final target location"""
+        grouped = self._memoized("by_target", None, lambda: {key: tuple(transfers) for key, transfers in group_by(
+            (transfer for batch in self for transfer in batch.transfers),
+            lambda transfer: transfer.final_target_location.artifact).items()})
+        return dict(grouped)
 
     def __len__(self):
         return len(self._batches)
@@ -820,10 +1038,144 @@ class TransferBatchCollection(object):
         """Returns the driver files (csvs) as a dictionary"""
         return {tb.name: tb.driver_file for tb in self}
 
+    def upload_driver_files(self, file_service, file_handle, file_prefix=FileService.FILE_PREFIX_ARTIFACT_ID):
+        """Writes the driver file of each batch to the upload queue one row at a time"""
+        for transfer_batch in self:
+            with file_service.open_upload(file_handle, transfer_batch.driver_file.file_name, file_prefix) as f:
+                transfer_batch.driver_file.write(f)
+
     def __repr__(self):
         return repr(self._batches)
 
 
+class DriverFile(object):
+    """
+    A robot driver file for a transfer batch. Provides the same content as the Csv created for a batch,
+    but maps each transfer to a row only while it's being written, so the rows are never all in memory.
+    """
+
+    def __init__(self, file_name, robot_settings, transfers):
+        self.file_name = file_name
+        self.robot_settings = robot_settings
+        self.transfers = transfers
+        self.delim = robot_settings.delimiter
+        self.newline = robot_settings.newline
+        self.header = robot_settings.header
+
+    def write(self, stream, include_header=True):
+        """Writes the driver file to a stream, e.g. one opened with FileService.open_upload"""
+        writer = CsvWriter(stream, self.delim, self.newline)
+        if include_header:
+            writer.write(self.header)
+        for transfer in self.transfers:
+            if self.robot_settings.include_transfer_in_output(transfer):
+                writer.write(self.robot_settings.map_transfer_to_row(transfer))
+
+    def to_string(self, include_header=True):
+        stream = StringIO()
+        self.write(stream, include_header)
+        return stream.getvalue()
+
+    def __repr__(self):
+        return "<DriverFile {}>".format(self.file_name)
+
+
+class RobotEvaluationCache(object):
+    """
+    Keeps the transfers, routes and batches evaluated for one robot between evaluations of a DilutionSession
+    in incremental mode, so only the routes of pairs that have changed need to be evaluated again.
+
+    A pair has changed if the UDFs, samples or wells of its artifacts have changed. Since handlers may look at
+    all transfers going into the same target (e.g. a pool), all pairs with the same target are evaluated again
+    if one of them has changed. All pairs are evaluated again if the settings have changed.
+    """
+
+    def __init__(self):
+        self.settings = None  # The attributes of the dilution and robot settings the routes were evaluated with
+        self.evaluated_routes = 0  # The number of routes evaluated over all evaluations
+        self.reset()
+
+    def reset(self):
+        """Forgets all transfers, routes and batches, so all pairs are evaluated again"""
+        self.containers = dict()  # Copies of the original containers, by id
+        self.temporary_containers = dict()  # The temporary containers the routes split transfers into, by original id
+        self.fingerprints = dict()  # By pair key
+        self.transfers = dict()  # The original transfer, by pair key
+        self.routes = dict()  # The transfer route, by original transfer
+        self.batches_by_name = dict()
+
+    def update_settings(self, dilution_settings, robot_settings):
+        """Resets the cache if the attributes of the settings have changed since the last evaluation"""
+        # Lists, dicts and sets are copied, so changes to their items are found too
+        settings = [{key: copy.copy(value) if isinstance(value, (list, dict, set)) else value
+                     for key, value in vars(obj).items()}
+                    for obj in (dilution_settings, robot_settings)]
+        if settings != self.settings:
+            self.reset()
+        self.settings = settings
+
+    def has_split_routes(self):
+        """Returns True if any of the routes was split, i.e. has a transfer in a temporary container"""
+        return any(len(route.transfers) > 1 for route in self.routes.values())
+
+    @staticmethod
+    def pair_key(pair):
+        return pair.input_artifact.id, pair.output_artifact.id
+
+    @staticmethod
+    def fingerprint(pair):
+        """Returns the values of a pair that the routes depend on"""
+        def artifact_fingerprint(artifact):
+            samples = getattr(artifact, "samples", None) or list()
+            return (artifact.container.id, artifact.well.position,
+                    artifact.udf_map.snapshot() if artifact.udf_map is not None else None,
+                    tuple(sample.udf_map.snapshot() if sample.udf_map is not None else None
+                          for sample in samples))
+        return artifact_fingerprint(pair.input_artifact), artifact_fingerprint(pair.output_artifact)
+
+    def transfers_from_pairs(self, pairs, create_transfers_from_pairs):
+        """
+        Returns the original transfers for all pairs, in order, and the transfers that need to be evaluated.
+        Transfers of pairs that haven't changed are the ones created in an earlier evaluation.
+        """
+        fingerprints = {self.pair_key(pair): self.fingerprint(pair) for pair in pairs}
+        changed_targets = set()
+        for key, fingerprint in fingerprints.items():
+            if self.fingerprints.get(key) != fingerprint:
+                changed_targets.add(key[1])
+        for key in self.fingerprints:
+            if key not in fingerprints:
+                changed_targets.add(key[1])
+                del self.transfers[key]
+
+        changed_pairs = [pair for pair in pairs if pair.output_artifact.id in changed_targets]
+        changed = create_transfers_from_pairs(changed_pairs, self.containers)
+        for pair, transfer in zip(changed_pairs, changed):
+            self.transfers[self.pair_key(pair)] = transfer
+        self.fingerprints = fingerprints
+        return [self.transfers[self.pair_key(pair)] for pair in pairs], changed
+
+    def update_routes(self, transfers, routes):
+        """
+        Replaces the routes of the pairs that were evaluated again. Returns all current routes by original
+        transfer and the names of the batches the routes that were replaced or added go into.
+        """
+        current = set(self.transfers.values())
+        affected_batches = set()
+        for transfer in self.routes.keys():
+            if transfer not in current:
+                affected_batches.update(t.batch for t in self.routes.pop(transfer).transfers)
+        for transfer, route in zip(transfers, routes):
+            self.routes[transfer] = route
+            affected_batches.update(t.batch for t in route.transfers)
+        self.evaluated_routes += len(routes)
+        return dict(self.routes), affected_batches
+
+    def update_batches(self, transfer_batches):
+        """Keeps the batches for the next evaluation"""
+        self.batches_by_name = {batch.name: batch for batch in transfer_batches}
+
+
 class ContainerSlot(object):
     """
     During a dilution, containers are positioned on a robot in a sequential order.
@@ -847,6 +1199,10 @@ class TransferHandlerBase(object):
     """Base class for all handlers"""
     __metaclass__ = abc.ABCMeta
 
+    # Set to True in handlers that implement `handle_transfers`, calculating the values for all transfers at once.
+    # Only used when the DilutionSession runs in batch mode.
+    supports_batch = False
+
     def __init__(self, dilution_session, dilution_settings, robot_settings, virtual_batch):
         self.dilution_session = dilution_session
         self.dilution_settings = dilution_settings
@@ -863,12 +1219,44 @@ class TransferHandlerBase(object):
         """Called by the engine"""
         transfer_route_node.handler = self
         if not self.should_execute(transfer_route_node.transfer):
-            return [TransferRouteNode(copy.copy(transfer_route_node.transfer))]
+            return [self._continue_with(transfer_route_node.transfer)]
         ret = self.handle_transfer(transfer_route_node.transfer)
         transfer_route_node.handler_executed = True
+        return self._children(transfer_route_node, ret)
+
+    def run_batch(self, transfer_route_nodes):
+        """
+        Called by the engine in batch mode. Returns a list of children for each of the nodes.
+
+        All transfers this handler should execute on are passed to `handle_transfers` in one call.
+        """
+        executed = list()
+        for node in transfer_route_nodes:
+            node.handler = self
+            if self.should_execute(node.transfer):
+                executed.append(node)
+        results = self.handle_transfers([node.transfer for node in executed])
+        ret_by_node = dict()
+        for node, ret in zip(executed, results):
+            node.handler_executed = True
+            ret_by_node[node] = self._children(node, ret)
+        return [ret_by_node[node] if node in ret_by_node else [self._continue_with(node.transfer)]
+                for node in transfer_route_nodes]
+
+    def _continue_with(self, transfer):
+        """
+        Returns the node the transfer continues in after this handler. The node shares the transfer, unless
+        the session debugs routes, in which case it gets a shallow copy, so each node keeps the values it had
+        after its handler.
+        """
+        if self.dilution_session.debug_routes:
+            transfer = copy.copy(transfer)
+        return TransferRouteNode(transfer)
+
+    def _children(self, transfer_route_node, ret):
         if ret is None:
-            # When nothing is returned, we continue with the same values, but a shallow copy for debugging
-            return [TransferRouteNode(copy.copy(transfer_route_node.transfer))]
+            # When nothing is returned, we continue with the same values
+            return [self._continue_with(transfer_route_node.transfer)]
         else:
             # Otherwise (when splitting) we return a list of new transfer route nodes:
             return [TransferRouteNode(t) for t in ret]
@@ -876,6 +1264,16 @@ class TransferHandlerBase(object):
     def handle_transfer(self, transfer):
         pass
 
+    def handle_transfers(self, transfers):
+        """
+        Handles all transfers at once, returning a list with one result per transfer in the same order. Each result
+        is what `handle_transfer` would have returned for that transfer.
+
+        Override this together with setting `supports_batch`, e.g. to calculate a value column by column
+        for all transfers rather than one transfer at a time.
+        """
+        return [self.handle_transfer(transfer) for transfer in transfers]
+
     def should_execute(self, transfer):
         return True
 
@@ -964,7 +1362,7 @@ class OrTransferHandler(TransferHandlerBase):
             transfer_node.executed = True
             return evaluated
         else:
-            return [TransferRouteNode(copy.copy(transfer_node.transfer))]
+            return [self._continue_with(transfer_node.transfer)]
 
     def __repr__(self):
         return "OR({})".format(", ".join(map(repr, self.sub_handlers)))
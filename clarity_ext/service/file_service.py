@@ -1,12 +1,19 @@
 from __future__ import print_function
 import re
+import csv
+import itertools
 import os
+import sys
+import time
 import shutil
 import logging
+from collections import namedtuple
+from contextlib import contextmanager
 from zipfile import ZipFile
 from lxml import objectify
-from clarity_ext import utils
 import requests
+from requests.packages.urllib3.exceptions import NewConnectionError, ConnectTimeoutError
+from clarity_ext import utils
 
 
 class FileService:
@@ -21,14 +28,25 @@ class FileService:
     FILE_PREFIX_ARTIFACT_ID = 1
     FILE_PREFIX_RUNNING_NUMBER = 2
 
+    # Number of files uploaded concurrently on commit
+    UPLOAD_WORKERS = 4
+    # Number of times an upload is retried after failing to connect, waiting
+    # UPLOAD_RETRY_BACKOFF seconds before the first retry and doubling the wait after that
+    UPLOAD_RETRIES = 3
+    UPLOAD_RETRY_BACKOFF = 1.0
+
     def __init__(self, artifact_service, file_repo, should_cache, os_service, uploaded_to_stdout=False,
-                 disable_commits=False, session=None):
+                 disable_commits=False, session=None, upload_workers=UPLOAD_WORKERS,
+                 upload_retries=UPLOAD_RETRIES, upload_retry_backoff=UPLOAD_RETRY_BACKOFF):
         """
         :param artifact_service: An artifact service instance.
         :param should_cache: Set to True if files should be cached in .cache, mainly
         for faster integration tests.
         :param uploaded_to_stdout: Set to True to output uploaded files to stdout
         :param disable_commits: Set to True to not upload files when committing. Used for testing.
+        :param upload_workers: The number of files uploaded concurrently on commit
+        :param upload_retries: The number of retries after an upload failed to connect to the server
+        :param upload_retry_backoff: Seconds to wait before the first retry, doubled for each retry after that
         """
         self._local_shared_files = []
         self.artifact_service = artifact_service
@@ -45,6 +63,9 @@ class FileService:
         self.session = session
         self.disable_commits = disable_commits
         self.uploaded_to_stdout = uploaded_to_stdout
+        self.upload_workers = upload_workers
+        self.upload_retries = upload_retries
+        self.upload_retry_backoff = upload_retry_backoff
 
         self.local_shared_file_provider = LocalSharedFileProvider(
             self, self.file_repo, self.artifact_service, self.downloaded_path,
@@ -67,9 +88,9 @@ class FileService:
             tree = objectify.parse(f)
             return tree.getroot()
 
-    def parse_csv(self, f):
+    def parse_csv(self, f, types=None, quoted=False):
         with f:
-            return Csv(f)
+            return Csv(f, types=types, quoted=quoted)
 
     def local_shared_file(self, file_handle, mode='r', extension="", modify_attached=False, file_name_contains=None):
         return self.local_shared_file_provider.\
@@ -87,7 +108,12 @@ class FileService:
                              filename=filename)
 
     def queue(self, downloaded_path, artifact, file_prefix):
-        file_name = os.path.basename(downloaded_path)
+        upload_path = self._upload_path(os.path.basename(downloaded_path), artifact, file_prefix)
+        self.os_service.copy_file(downloaded_path, upload_path)
+        return upload_path
+
+    def _upload_path(self, file_name, artifact, file_prefix):
+        """Returns the path in the upload queue a file should be written to, creating its directory"""
         self.artifactid_by_filename[file_name] = artifact.id
         if file_prefix == FileService.FILE_PREFIX_ARTIFACT_ID and not file_name.startswith(artifact.id):
             file_name = "{}_{}".format(artifact.id, file_name)
@@ -103,9 +129,7 @@ class FileService:
 
         upload_dir = os.path.join(self.upload_queue_path, artifact.id)
         self.os_service.makedirs(upload_dir)
-        upload_path = os.path.join(upload_dir, file_name)
-        self.os_service.copy_file(downloaded_path, upload_path)
-        return upload_path
+        return os.path.join(upload_dir, file_name)
 
     def remove_files(self, file_handle, disabled, exclude_list=None):
         """Removes all files for the particular file handle.
@@ -185,6 +209,28 @@ class FileService:
                      if shared_file.name == file_handle], key=lambda x: x.id)
         self._upload_single(artifacts[0], file_handle, instance_name, content, file_prefix)
 
+    @contextmanager
+    def open_upload(self, file_handle, instance_name, file_prefix):
+        """
+        Opens a file in the upload queue for writing, for files that are too large to build as a string first.
+        The file is uploaded on commit, like files queued with `upload`.
+
+            with file_service.open_upload("Sample List", csv.file_name, FileService.FILE_PREFIX_NONE) as f:
+                csv.write(f)
+
+        :param file_handle: The handle of the file in the Clarity UI
+        :param instance_name: The name of this particular file
+        :param file_prefix: Any of the FILE_PREFIX_* values
+        """
+        artifacts = sorted([shared_file for shared_file in self.artifact_service.shared_files()
+                            if shared_file.name == file_handle], key=lambda x: x.id)
+        upload_path = self._upload_path(instance_name, artifacts[0], file_prefix)
+        self.logger.info("Writing file '{}' for upload to the server, file handle '{}'".format(
+            upload_path, file_handle))
+        # The file is opened in binary form to ensure that Windows line endings are used if specified
+        with self.os_service.open_file(upload_path, 'wb') as f:
+            yield f
+
     def _upload_single(self, artifact, file_handle, instance_name, content, file_prefix):
         """Queues the file for update. Call commit to send to the server."""
         local_path = self.save_locally(content, instance_name)
@@ -198,22 +244,109 @@ class FileService:
     def commit(self, disable_commits):
         """Copies files in the upload queue to the server"""
         self.close_local_shared_files()
-        for artifact_id in self.os_service.listdir(self.upload_queue_path):
+        queued = list()
+        for artifact_id in sorted(self.os_service.listdir(self.upload_queue_path)):
             for file_name in self.os_service.listdir(os.path.join(self.upload_queue_path, artifact_id)):
                 if disable_commits:
                     self.logger.info("Uploading (disabled) file: {}".format(os.path.abspath(file_name)))
                 else:
-                    artifact = utils.single([shared_file for shared_file in self.artifact_service.shared_files()
-                                             if shared_file.id == artifact_id])
-                    local_file = os.path.join(self.upload_queue_path, artifact_id, file_name)
-                    self.logger.info("Uploading file {}".format(local_file))
-                    try:
-                        self.session.api.upload_new_file(artifact.api_resource, local_file)
-                    except requests.HTTPError as e:
-                        if "UNDER_REVIEW" in str(e):
-                            self.logger.error("Not able to upload step log as some of the samples are in review")
-                        else:
-                            raise e
+                    queued.append((artifact_id, os.path.join(self.upload_queue_path, artifact_id, file_name)))
+        if not queued:
+            return
+
+        shared_files_by_id = {shared_file.id: shared_file for shared_file in self.artifact_service.shared_files()}
+        uploads = list()
+        for artifact_id, local_file in queued:
+            if artifact_id not in shared_files_by_id:
+                raise SharedFileNotFound("No shared file with id '{}' to upload {} to".format(
+                    artifact_id, local_file))
+            uploads.append((shared_files_by_id[artifact_id], local_file))
+
+        start = time.time()
+        results = self._map_uploads(uploads)
+        failures = [result for result in results if result.exc_info is not None]
+        self.logger.info("Uploaded {} of {} files in {:.2f}s".format(
+            len(results) - len(failures), len(results), time.time() - start))
+        for result in results:
+            self.logger.debug("Upload of {} took {:.2f}s in {} attempt(s)".format(
+                result.local_file, result.elapsed, result.attempts))
+        for result in failures:
+            self.logger.error("Failed to upload {}: {}".format(result.local_file, result.exc_info[1]),
+                              exc_info=result.exc_info)
+        if failures:
+            exc_type, exc_value, exc_traceback = failures[0].exc_info
+            raise exc_type, exc_value, exc_traceback
+
+    def _map_uploads(self, uploads):
+        """
+        Uploads each (artifact, local_file) pair, concurrently if upload_workers allows it. Returns an
+        UploadResult for each pair, in the same order.
+
+        The files of one artifact are uploaded one at a time, in the order they were queued, so the file
+        that ends up attached to the artifact doesn't depend on which upload finished first.
+        """
+        uploads_by_artifact = list()
+        files_by_artifact_id = dict()
+        for ix, (artifact, local_file) in enumerate(uploads):
+            if artifact.id not in files_by_artifact_id:
+                files_by_artifact_id[artifact.id] = list()
+                uploads_by_artifact.append((artifact, files_by_artifact_id[artifact.id]))
+            files_by_artifact_id[artifact.id].append((ix, local_file))
+
+        def upload_all(artifact_uploads):
+            artifact, indexed_files = artifact_uploads
+            return [(ix, self._upload_with_retry(artifact, local_file)) for ix, local_file in indexed_files]
+
+        results = utils.map_concurrently(upload_all, uploads_by_artifact, self.upload_workers)
+        return [result for ix, result in sorted(indexed for group in results for indexed in group)]
+
+    def _upload_with_retry(self, artifact, local_file):
+        """
+        Uploads a single file, retrying with exponential backoff if the upload failed before reaching the server.
+
+        Uploading creates the storage location and the file in separate requests, so an upload that failed after
+        the server got it is not retried, as that could attach the file twice.
+
+        Errors are returned in the result, with their traceback, rather than raised, so the other uploads
+        can finish.
+        """
+        start = time.time()
+        attempt = 0
+        while True:
+            attempt += 1
+            self.logger.info("Uploading file {}".format(local_file))
+            try:
+                self.session.api.upload_new_file(artifact.api_resource, local_file)
+                return UploadResult(local_file, time.time() - start, attempt, None)
+            except requests.HTTPError as e:
+                if "UNDER_REVIEW" in str(e):
+                    self.logger.error("Not able to upload step log as some of the samples are in review")
+                    return UploadResult(local_file, time.time() - start, attempt, None)
+                exc_info = sys.exc_info()
+            except Exception:
+                exc_info = sys.exc_info()
+
+            error = exc_info[1]
+            if attempt > self.upload_retries or not self._never_reached_server(error):
+                return UploadResult(local_file, time.time() - start, attempt, exc_info)
+            delay = self.upload_retry_backoff * 2 ** (attempt - 1)
+            self.logger.warning("Upload of {} failed ({}), retrying in {}s".format(local_file, error, delay))
+            time.sleep(delay)
+
+    @staticmethod
+    def _never_reached_server(error):
+        """
+        Returns True if the error was raised while connecting to the server, i.e. the server never got the
+        request. Other errors, such as read timeouts or server errors, may have happened after the server
+        created the file.
+        """
+        if isinstance(error, requests.exceptions.ConnectTimeout):
+            return True
+        if not isinstance(error, requests.ConnectionError) or not error.args:
+            return False
+        # requests wraps the error from urllib3, which has the cause of the failed connection in `reason`
+        reason = getattr(error.args[0], "reason", None)
+        return isinstance(reason, (NewConnectionError, ConnectTimeoutError))
 
     def _split_file_name(self, name):
         m = re.match(self.SERVER_FILE_NAME_PATTERN, name)
@@ -242,6 +375,10 @@ class FileService:
         return full_path
 
 
+# exc_info is the (type, value, traceback) of the error that made the upload fail, or None if it succeeded
+UploadResult = namedtuple("UploadResult", ["local_file", "elapsed", "attempts", "exc_info"])
+
+
 class LocalSharedFileProvider:
     def __init__(self, file_service, file_repo, artifact_service, downloaded_path, os_service, should_cache, logger):
         self.file_service = file_service
@@ -343,10 +480,10 @@ class LocalSharedFileProvider:
 
     def _copy_remote_file(self, artifact, local_file_name_abs_path):
         file = artifact.api_resource.files[0]  # TODO: Hide this logic
-        self.logger.info("Downloading file {} (artifact={} '{}')"
+        self.logger.info("Fetching file {} (artifact={} '{}')"
                          .format(file.id, artifact.id, artifact.name))
-        self.file_repo.copy_remote_file(file.id, local_file_name_abs_path)
-        self.logger.info("Download completed, path='{}'".format(os.path.relpath(local_file_name_abs_path)))
+        self.file_repo.copy_remote_file(file.id, local_file_name_abs_path, content_location=file.content_location)
+        self.logger.info("Fetched file, path='{}'".format(os.path.relpath(local_file_name_abs_path)))
 
     def _artifact_by_name(self, file_handle, filename=None, fallback_on_first_unassigned=False):
         shared_files = self.artifact_service.shared_files()
@@ -381,32 +518,141 @@ class SharedFileNotFound(Exception):
     pass
 
 
-class Csv:
-    """A simple wrapper for csv files"""
-    def __init__(self, file_stream=None, delim=",", file_name=None, newline="\n", header=None):
+class Csv(object):
+    """
+    A simple wrapper for csv files
+
+    Files are parsed with the csv module. The rows read are kept as lists and are only wrapped in CsvLine
+    objects when `data` is first used, while `column` and `columns` give the values by column.
+    """
+    def __init__(self, file_stream=None, delim=",", file_name=None, newline="\n", header=None, types=None,
+                 quoted=False):
+        """
+        :param types: Functions converting the values in columns from strings, by column name,
+                      e.g. {"Concentration": float}. Empty values are converted to None.
+        :param quoted: Set to True if values may be in double quotes, e.g. to contain the delimiter.
+                       Otherwise quotes are kept in the values.
+        """
         self.header = list()
-        self.data = list()
+        self._data = list()
+        self._rows = list()  # Rows read from the file, not yet wrapped in CsvLine objects
         if file_stream:
             if isinstance(file_stream, basestring):
                 with open(file_stream, "r") as fs:
-                    self._init_from_file_stream(fs, delim, None)
+                    self._init_from_file_stream(fs, delim, None, types, quoted)
             else:
-                self._init_from_file_stream(file_stream, delim, header)
+                self._init_from_file_stream(file_stream, delim, header, types, quoted)
         self.file_name = file_name
         self.delim = delim
         self.newline = newline
 
-    def _init_from_file_stream(self, file_stream, delim, header):
-        lines = list()
-        if header is not None:
-            self.set_header(header)
-
-        for ix, line in enumerate(file_stream):
-            values = line.strip().split(delim)
-            if ix == 0 and header is None:
-                self.set_header(values)
+    def _init_from_file_stream(self, file_stream, delim, header, types=None, quoted=False):
+        self._rows = list(self._read(file_stream, delim, header, types, quoted))
+
+    def _read(self, file_stream, delim, header, types, quoted):
+        """Sets the header and yields the rest of the rows, with values converted according to types"""
+        rows = self._parse(file_stream, delim, quoted)
+
+        if header is None:
+            header = next(rows, None)
+            if header is None:
+                return
+        self.set_header(header)
+        conversions = [(self.key_to_index[key], fn) for key, fn in (types or dict()).items()]
+
+        if not conversions:
+            for row in rows:
+                # An empty line is read as one empty value
+                yield row or [""]
+            return
+
+        width = max(ix for ix, fn in conversions) + 1
+        for row in rows:
+            if len(row) < width:
+                row = row or [""]
+                converted = [(ix, fn) for ix, fn in conversions if ix < len(row)]
             else:
-                self.append(values)
+                converted = conversions
+            for ix, fn in converted:
+                value = row[ix]
+                row[ix] = fn(value) if value else None
+            yield row
+
+    @staticmethod
+    def _parse(lines, delim, quoted):
+        """
+        Yields the values in each line.
+
+        The lines are parsed with the csv module, but are split on the delimiter, as they were before it was
+        used, when the csv module can't read them: unicode lines, lines with NUL bytes (e.g. UTF-16 exports)
+        and multi character delimiters.
+        """
+        lines = iter(lines)
+        first = next(lines, None)
+        if first is None:
+            return
+        lines = itertools.chain([first], lines)
+        if len(delim) != 1 or isinstance(first, unicode):
+            for line in lines:
+                yield line.strip().split(delim)
+            return
+
+        last_line = [None]
+
+        def track(lines):
+            for line in lines:
+                last_line[0] = line
+                yield line if quoted else line.strip()
+
+        if quoted:
+            reader = csv.reader(track(lines), delimiter=delim)
+        else:
+            reader = csv.reader(track(lines), delimiter=delim, quoting=csv.QUOTE_NONE)
+        try:
+            for row in reader:
+                yield row
+        except (csv.Error, UnicodeError):
+            # Split the line the csv module failed on and the lines after it
+            yield last_line[0].strip().split(delim)
+            for line in lines:
+                yield line.strip().split(delim)
+
+    @classmethod
+    def iter_lines(cls, file_stream, delim=",", header=None, types=None, quoted=False):
+        """
+        Yields the lines in the file stream as CsvLine objects, reading one line at a time. Use this rather
+        than creating a Csv for files that are too large to keep in memory.
+        """
+        ret = cls(delim=delim)
+        for row in ret._read(file_stream, delim, header, types, quoted):
+            yield CsvLine(row, ret)
+
+    @property
+    def data(self):
+        """The lines in the csv, as CsvLine objects"""
+        if self._rows:
+            self._data.extend(CsvLine(row, self) for row in self._rows)
+            self._rows = list()
+        return self._data
+
+    @data.setter
+    def data(self, lines):
+        """Replaces the lines in the csv, with a list of CsvLine objects"""
+        self._data = lines
+        self._rows = list()
+
+    def _values(self):
+        """Returns the values of all lines, as lists"""
+        return self._rows or [line.line for line in self._data]
+
+    def column(self, key):
+        """Returns the values in the column, with None for lines that are too short to have one"""
+        ix = self.key_to_index[key]
+        return [row[ix] if ix < len(row) else None for row in self._values()]
+
+    def columns(self):
+        """Returns the values in all columns, by column name"""
+        return {key: self.column(key) for key in self.header}
 
     def set_header(self, header):
         self.key_to_index = {key: ix for ix, key in enumerate(header)}
@@ -428,6 +674,14 @@ class Csv:
             ret.append(self.delim.join(map(str, line)))
         return self.newline.join(ret)
 
+    def write(self, stream, include_header=True):
+        """Writes the csv to a stream, with the same content as to_string"""
+        writer = CsvWriter(stream, self.delim, self.newline)
+        if include_header:
+            writer.write(self.header)
+        for line in self.data:
+            writer.write(line)
+
     def __repr__(self):
         return "<Csv {}>".format(self.file_name)
 
@@ -458,6 +712,28 @@ class CsvLine:
         return repr(self.values)
 
 
+class CsvWriter(object):
+    """
+    Writes lines to a stream one at a time, formatted as in Csv.to_string. Unicode is written as UTF-8.
+
+    Lines are separated rather than terminated by the newline, so there's no newline after the last one.
+    """
+    def __init__(self, stream, delim=",", newline="\n"):
+        self.stream = stream
+        self.delim = delim
+        self.newline = newline
+        self.line_count = 0
+
+    def write(self, values):
+        line = self.delim.join(map(str, values))
+        if isinstance(line, unicode):
+            line = line.encode("utf-8")
+        if self.line_count > 0:
+            self.stream.write(self.newline)
+        self.stream.write(line)
+        self.line_count += 1
+
+
 class OSService(object):
     """Provides access to OS file methods for testability"""
 
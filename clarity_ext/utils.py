@@ -4,6 +4,7 @@ import shutil
 import hashlib
 import logging
 from contextlib import contextmanager
+from multiprocessing.pool import ThreadPool
 import types
 
 
@@ -68,6 +69,40 @@ def clean_directory(path, skip=[]):
             os.remove(item)
 
 
+def replace_file(src, dst):
+    """
+    Moves the file src to dst, replacing dst if it exists.
+
+    The move is atomic on POSIX. On Windows, os.rename fails if dst exists, so dst is removed first.
+    """
+    if os.name == "nt" and os.path.exists(dst):
+        os.remove(dst)
+    os.rename(src, dst)
+
+
+def map_concurrently(fn, items, workers):
+    """
+    Calls fn for each item on up to `workers` threads. Returns the results in the same order as the items.
+
+    With one worker, or one item, fn is called on the calling thread.
+    """
+    items = list(items)
+    workers = min(workers, len(items))
+    if workers <= 1:
+        return map(fn, items)
+    pool = ThreadPool(workers)
+    try:
+        return pool.map(fn, items)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def user_cache_dir(name):
+    """Returns the path to a directory for data that's cached between runs, e.g. ~/.clarity-ext/cache/<name>"""
+    return os.path.join(os.path.expanduser("~"), ".clarity-ext", "cache", name)
+
+
 def single(seq):
     """Returns the first element in a list, throwing an exception if there is an unexpected number of items"""
     if isinstance(seq, types.GeneratorType):
@@ -0,0 +1,57 @@
+"""
+Measures the time it takes to read a large plate reader export with Csv, compared to splitting each line
+and wrapping it in a CsvLine, as was done before the csv module was used.
+
+Run with:
+
+    python -m test.benchmark.bench_csv
+"""
+from __future__ import print_function
+import timeit
+from cStringIO import StringIO
+from clarity_ext.service.file_service import Csv, CsvLine
+
+ROWS = 50000
+ROUNDS = 5
+HEADER = ["Well", "Sample", "Conc", "Volume", "Size", "Molarity", "RFU", "Dilution", "Comment", "Flag"]
+
+
+def create_content():
+    lines = [",".join(HEADER)]
+    for ix in range(ROWS):
+        lines.append("A:{},sample{},{:.2f},{:.1f},{},{:.3f},{},1,,OK".format(
+            ix % 384, ix, ix * 0.01, 20.0, 300 + ix % 100, ix * 0.001, ix * 3))
+    return "\r\n".join(lines)
+
+
+def read_split(content):
+    """Reads the lines as they were read before the csv module was used"""
+    ret = Csv()
+    for ix, line in enumerate(StringIO(content)):
+        values = line.strip().split(",")
+        if ix == 0:
+            ret.set_header(values)
+        else:
+            ret._data.append(CsvLine(values, ret))
+    return ret
+
+
+def report(name, fn):
+    seconds = min(timeit.repeat(fn, number=1, repeat=ROUNDS))
+    print("{:<36} {:>8.3f}s".format(name, seconds))
+
+
+def main():
+    content = create_content()
+    types = {"Conc": float, "Volume": float, "Size": int, "Molarity": float}
+    print("{} rows, best of {} rounds".format(ROWS, ROUNDS))
+    report("Split lines into CsvLines", lambda: read_split(content))
+    report("Csv", lambda: Csv(StringIO(content)))
+    report("Csv, wrapped in CsvLines", lambda: Csv(StringIO(content)).data)
+    report("Csv with types", lambda: Csv(StringIO(content), types=types))
+    report("Csv with types, column", lambda: Csv(StringIO(content), types=types).column("Conc"))
+    report("Csv.iter_lines with types", lambda: sum(1 for _ in Csv.iter_lines(StringIO(content), types=types)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+"""
+Measures the time it takes to evaluate a DilutionSession with four 384 well plates, with the handlers run
+one transfer at a time and in batch mode, and the transfers allocated in the transfer routes with and
+without debug_routes.
+
+Run with:
+
+    python -m test.benchmark.bench_dilution
+"""
+from __future__ import print_function
+import timeit
+from mock import MagicMock
+from clarity_ext.domain import Analyte, ArtifactPair, Container, PlateSize
+from clarity_ext.domain.udf import UdfMapping
+from clarity_ext.service.dilution.service import DilutionSession, DilutionSettings, RobotSettings
+from clarity_ext.service.dilution.service import TransferHandlerBase, VirtualTransferBatch
+
+PLATES = 4
+PLATE_SIZE = PlateSize(height=16, width=24)
+ROUNDS = 5
+
+
+class BenchRobotSettings(RobotSettings):
+    def __init__(self):
+        super(BenchRobotSettings, self).__init__()
+        self.name = "bench"
+        self.delimiter = ","
+        self.newline = "\n"
+        self.header = ["Source", "Target", "Sample", "Buffer"]
+        self.dilution_waste_volume = 1
+        self.pipette_min_volume = 2
+        self.pipette_max_volume = 50
+
+    def map_transfer_to_row(self, transfer):
+        return [transfer.source_location.position, transfer.target_location.position,
+                transfer.pipette_sample_volume, transfer.pipette_buffer_volume]
+
+    def get_index_from_well(self, well):
+        return well.index_down_first
+
+    def get_filename(self, transfer_batch, context, ix):
+        return "{}_{}.csv".format(self.name, ix)
+
+    @staticmethod
+    def transfer_batch_sort_key(transfer_batch):
+        return transfer_batch.name
+
+
+class MeasurementsHandler(TransferHandlerBase):
+    def handle_transfer(self, transfer):
+        transfer.source_conc = transfer.source_location.artifact.udf_conc_current_nm
+        transfer.source_vol = transfer.source_location.artifact.udf_current_sample_volume_ul
+        transfer.target_conc = transfer.target_location.artifact.udf_target_conc_nm
+        transfer.target_vol = transfer.target_location.artifact.udf_target_vol_ul
+
+
+class CalculateVolumesHandler(TransferHandlerBase):
+    """Calculates sample and buffer volumes, scaling up volumes that are too low to pipette"""
+    def handle_transfer(self, transfer):
+        sample_volume = float(transfer.target_conc) * transfer.target_vol / transfer.source_conc
+        buffer_volume = transfer.target_vol - sample_volume
+        if sample_volume < self.robot_settings.pipette_min_volume:
+            scale = self.robot_settings.pipette_min_volume / sample_volume
+            sample_volume, buffer_volume = sample_volume * scale, buffer_volume * scale
+            transfer.scaled_up = True
+        transfer.pipette_sample_volume = sample_volume
+        transfer.pipette_buffer_volume = buffer_volume
+        transfer.has_to_evaporate = buffer_volume < 0
+        transfer.source_vol_delta = -(sample_volume + self.robot_settings.dilution_waste_volume)
+
+
+class BatchCalculateVolumesHandler(CalculateVolumesHandler):
+    """Same calculation as CalculateVolumesHandler, column by column over all transfers"""
+    supports_batch = True
+
+    def handle_transfers(self, transfers):
+        min_volume = self.robot_settings.pipette_min_volume
+        waste = self.robot_settings.dilution_waste_volume
+        target_vols = [t.target_vol for t in transfers]
+        sample_vols = [float(t.target_conc) * t.target_vol / t.source_conc for t in transfers]
+        buffer_vols = [tv - v for tv, v in zip(target_vols, sample_vols)]
+        scales = [min_volume / v if v < min_volume else 1.0 for v in sample_vols]
+        sample_vols = [v * s for v, s in zip(sample_vols, scales)]
+        buffer_vols = [v * s for v, s in zip(buffer_vols, scales)]
+        for t, sample_vol, buffer_vol, scale in zip(transfers, sample_vols, buffer_vols, scales):
+            t.pipette_sample_volume = sample_vol
+            t.pipette_buffer_volume = buffer_vol
+            t.scaled_up = scale != 1.0
+            t.has_to_evaporate = buffer_vol < 0
+            t.source_vol_delta = -(sample_vol + waste)
+        return [None] * len(transfers)
+
+
+class ValidateVolumesHandler(TransferHandlerBase):
+    def handle_transfer(self, transfer):
+        if transfer.pipette_total_volume > self.robot_settings.pipette_max_volume:
+            self.error("Too high volume", transfer)
+
+
+class BatchValidateVolumesHandler(ValidateVolumesHandler):
+    supports_batch = True
+
+    def handle_transfers(self, transfers):
+        max_volume = self.robot_settings.pipette_max_volume
+        for t in transfers:
+            if t.pipette_sample_volume + t.pipette_buffer_volume > max_volume:
+                self.error("Too high volume", t)
+        return [None] * len(transfers)
+
+
+def create_pairs():
+    pairs = list()
+    for plate in range(PLATES):
+        source = Container(size=PLATE_SIZE, container_id="source{}".format(plate), is_source=True)
+        target = Container(size=PLATE_SIZE, container_id="target{}".format(plate), is_source=False)
+        for ix, well in enumerate(source.enumerate_wells()):
+            name = "{}-{}".format(plate, well.position)
+            pair = ArtifactPair(Analyte(None, True, id="in-" + name, name="in-" + name),
+                                Analyte(None, False, id="out-" + name, name="out-" + name))
+            pair.input_artifact.udf_map = UdfMapping({"Conc. Current (nM)": 10.0 + ix % 50,
+                                                      "Current sample volume (ul)": 40.0})
+            pair.output_artifact.udf_map = UdfMapping({"Target conc. (nM)": 2.0,
+                                                       "Target vol. (ul)": 20.0})
+            source.set_well_update_artifact(well.position, artifact=pair.input_artifact)
+            target.set_well_update_artifact(well.position, artifact=pair.output_artifact)
+            pairs.append(pair)
+    return pairs
+
+
+def create_session(handlers, batch_mode=False, debug_routes=False):
+    settings = DilutionSettings(concentration_ref="nM", sort_strategy=lambda t: t.source_location.index_down_first)
+    return DilutionSession(MagicMock(), [BenchRobotSettings()], settings, MagicMock(), MagicMock(),
+                           handlers, [], batch_mode=batch_mode, debug_routes=debug_routes)
+
+
+def evaluate(pairs, handlers, batch_mode=False, debug_routes=False):
+    session = create_session(handlers, batch_mode, debug_routes)
+    session.evaluate(pairs)
+    return session
+
+
+def count_route_transfers(pairs, handlers, debug_routes):
+    """Returns the number of route nodes and distinct transfer objects in the routes of all transfers"""
+    session = create_session(handlers, debug_routes=debug_routes)
+    transfers = session.create_transfers_from_pairs(pairs)
+    transfer_handlers, _ = session.init_handlers(handlers, [], session.dilution_settings,
+                                                 session.robot_settings[0], VirtualTransferBatch(transfers))
+    nodes = [node for transfer in transfers
+             for node, level in session.evaluate_transfer_route(transfer, transfer_handlers).walk()]
+    return len(nodes), len(set(node.transfer for node in nodes))
+
+
+def main():
+    pairs = create_pairs()
+    print("{} transfers, best of {} rounds".format(len(pairs), ROUNDS))
+    scalar = [MeasurementsHandler, CalculateVolumesHandler, ValidateVolumesHandler]
+    batched = [MeasurementsHandler, BatchCalculateVolumesHandler, BatchValidateVolumesHandler]
+    for name, handlers, batch_mode in [("One transfer at a time", scalar, False),
+                                       ("Batch mode", batched, True)]:
+        seconds = min(timeit.repeat(lambda: evaluate(pairs, handlers, batch_mode), number=1, repeat=ROUNDS))
+        print("{:<24} {:>8.3f}s".format(name, seconds))
+    for name, debug_routes in [("debug_routes=True", True), ("debug_routes=False", False)]:
+        seconds = min(timeit.repeat(lambda: evaluate(pairs, scalar, debug_routes=debug_routes),
+                                    number=1, repeat=ROUNDS))
+        nodes, transfers = count_route_transfers(pairs, scalar, debug_routes)
+        print("{:<24} {:>8.3f}s {:>6} route nodes {:>6} transfers".format(name, seconds, nodes, transfers))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Measures the memory used by the domain objects that exist in large numbers, i.e. wells, positions and UDFs.
+
+Wells and positions are compared with equivalents that keep their attributes in a __dict__, as they did
+before they defined __slots__. The UDFs of an artifact are compared with the UdfMapping layout from before
+UDF names were kept in shared schemas, which had a UdfInfo object and name map entries per UDF. Run with:
+
+    python -m test.benchmark.bench_domain_memory
+"""
+from __future__ import print_function
+import sys
+import time
+from collections import namedtuple
+from clarity_ext.domain.container import Container, ContainerPosition, PlateSize, Well
+from clarity_ext.domain.udf import UdfMapping
+
+PLATES = 4
+PLATE_SIZE = PlateSize(height=16, width=24)
+UDFS_PER_ARTIFACT = 40
+
+
+class DictWell(object):
+    def __init__(self, position, container, artifact=None):
+        self.position = position
+        self.container = container
+        self.artifact = artifact
+
+
+class DictContainerPosition(namedtuple("ContainerPosition", ["row", "col"])):
+    pass
+
+
+class DictUdfInfo(object):
+    def __init__(self, key, value):
+        self.key = key
+        self.value = value
+        self._original_value = value
+
+
+class DictUdfMapping(object):
+    def __init__(self, udfs):
+        self.raw_map = dict()
+        self.values = set()
+        self.py_names = set()
+        for key, value in udfs.items():
+            udf_info = DictUdfInfo(key, value)
+            self.values.add(udf_info)
+            self.raw_map[key] = [udf_info]
+            py_name = UdfMapping._automap_name(key)
+            self.raw_map.setdefault(py_name, list()).append(udf_info)
+            self.py_names.add(py_name)
+
+
+def size_of(obj):
+    """The size of the object itself and its instance dictionary, if it has one. Attribute values are not included"""
+    size = sys.getsizeof(obj)
+    # NOTE: The instance dictionary of a tuple subclass is only allocated when it's used, and namedtuples
+    # define a __dict__ property, so only the size of the tuple itself is counted for those
+    if type(obj).__dictoffset__ and not isinstance(obj, tuple):
+        size += sys.getsizeof(vars(obj))
+    return size
+
+
+def size_of_udf_mapping(udf_map):
+    """The size of the UDF mapping and the objects it owns. The UDF names, values and schema are shared"""
+    if isinstance(udf_map, DictUdfMapping):
+        owned = [udf_map.raw_map, udf_map.values, udf_map.py_names] + list(udf_map.raw_map.values()) + \
+            list(udf_map.values)
+    else:
+        owned = [udf_map._values, udf_map._original_by_slot]
+    return size_of(udf_map) + sum(size_of(obj) for obj in owned)
+
+
+def measure(name, create, count, size_fn=size_of):
+    start = time.time()
+    objects = [create(i) for i in xrange(count)]
+    elapsed = time.time() - start
+    total = sum(size_fn(obj) for obj in objects)
+    print("{:<28} {:>8} objects {:>10} bytes {:>8.3f}s".format(name, count, total, elapsed))
+    return total
+
+
+def main():
+    wells = PLATES * PLATE_SIZE.height * PLATE_SIZE.width
+    container = Container(size=PLATE_SIZE)
+    udfs = {"Custom UDF #{}".format(i): float(i) for i in xrange(UDFS_PER_ARTIFACT)}
+
+    results = [
+        ("Well", measure("Well (__dict__)", lambda i: DictWell(None, container), wells),
+         measure("Well (__slots__)", lambda i: Well(None, container), wells)),
+        ("ContainerPosition", measure("ContainerPosition (__dict__)", lambda i: DictContainerPosition(1, i), wells),
+         measure("ContainerPosition (__slots__)", lambda i: ContainerPosition(1, i), wells)),
+        ("UdfMapping", measure("UdfMapping (per object map)", lambda i: DictUdfMapping(udfs), wells,
+                               size_of_udf_mapping),
+         measure("UdfMapping (shared schema)", lambda i: UdfMapping(udfs), wells, size_of_udf_mapping)),
+    ]
+    print()
+    for name, before, after in results:
+        print("{:<20} {:>6.1f}% smaller".format(name, 100.0 * (before - after) / before))
+
+
+if __name__ == "__main__":
+    main()
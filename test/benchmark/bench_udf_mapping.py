@@ -0,0 +1,42 @@
+"""
+Measures the time it takes to create UdfMappings, as is done for every domain object in a step.
+
+Run with:
+
+    python -m test.benchmark.bench_udf_mapping
+"""
+from __future__ import print_function
+import re
+import timeit
+from clarity_ext.domain.udf import UdfMapping
+
+OBJECTS = 10000
+UDFS = {"Concentration": 10.0, "Volume (uL)": 20.0, "Conc. Current (ng/uL)": 1.5, "% Total": 50,
+        "Target vol (uL)": 10, "Target conc (ng/uL)": 2.0, "Number of Lanes": 1, "Pooling": "Yes",
+        "Sample Type": "DNA", "Fragment Lower (bp)": 200, "Fragment Upper (bp)": 500, "Comment": ""}
+
+
+def automap_name_uncached(original_udf_name):
+    """The name mapping as it was done before it was cached"""
+    new_name = original_udf_name.lower().replace(" ", "_")
+    new_name = re.sub(r"\W+", "", new_name)
+    new_name = "udf_{}".format(new_name)
+    new_name = re.sub("_{2,}", "_", new_name)
+    return new_name
+
+
+def report(name, seconds):
+    print("{:<36} {:>8.3f}s {:>8.1f} us/object".format(name, seconds, 1e6 * seconds / OBJECTS))
+
+
+def main():
+    print("{} objects with {} UDFs each".format(OBJECTS, len(UDFS)))
+    report("Name mapping, uncached",
+           timeit.timeit(lambda: [automap_name_uncached(key) for key in UDFS], number=OBJECTS))
+    report("Name mapping, cached",
+           timeit.timeit(lambda: [UdfMapping._automap_name(key) for key in UDFS], number=OBJECTS))
+    report("UdfMapping(udfs)", timeit.timeit(lambda: UdfMapping(UDFS), number=OBJECTS))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,401 @@
+import threading
+import unittest
+from mock import MagicMock
+from cStringIO import StringIO
+from clarity_ext.service.dilution.service import DilutionSession, DilutionSettings, RobotSettings
+from clarity_ext.service.dilution.service import TransferHandlerBase, VirtualTransferBatch
+from clarity_ext.service.dilution.service import TransferBatch, TransferBatchCollection, TransferSplitHandlerBase
+from clarity_ext.service.file_service import FileService
+from clarity_ext.utility.testing import DilutionTestDataHelper
+from clarity_ext import utils
+
+
+class FakeRobotSettings(RobotSettings):
+    def __init__(self, name="robot1"):
+        super(FakeRobotSettings, self).__init__()
+        self.name = name
+        self.delimiter = ","
+        self.newline = "\n"
+        self.header = ["Source", "Target", "Sample", "Buffer"]
+        self.pipette_min_volume = 2
+
+    def map_transfer_to_row(self, transfer):
+        return [transfer.source_location.position, transfer.target_location.position,
+                transfer.pipette_sample_volume, transfer.pipette_buffer_volume]
+
+    def get_index_from_well(self, well):
+        return well.index_down_first
+
+    def get_filename(self, transfer_batch, context, ix):
+        return "{}_{}.csv".format(self.name, ix)
+
+    @staticmethod
+    def transfer_batch_sort_key(transfer_batch):
+        return transfer_batch.name
+
+
+class MeasurementsHandler(TransferHandlerBase):
+    def handle_transfer(self, transfer):
+        source = transfer.source_location.artifact.udf_map
+        target = transfer.target_location.artifact.udf_map
+        transfer.source_conc = source["Conc. Current (nM)"].value
+        transfer.source_vol = source["Current sample volume (ul)"].value
+        transfer.target_conc = target["Target conc. (nM)"].value
+        transfer.target_vol = target["Target vol. (ul)"].value
+
+
+class SampleVolumeHandler(TransferHandlerBase):
+    supports_batch = True
+    batch_calls = 0
+
+    def handle_transfer(self, transfer):
+        self.handle_transfers([transfer])
+
+    def handle_transfers(self, transfers):
+        SampleVolumeHandler.batch_calls += 1
+        sample_volumes = [float(t.target_conc) * t.target_vol / t.source_conc for t in transfers]
+        for transfer, sample_volume in zip(transfers, sample_volumes):
+            transfer.pipette_sample_volume = sample_volume
+            transfer.pipette_buffer_volume = transfer.target_vol - sample_volume
+        return [None] * len(transfers)
+
+
+class MinVolumeHandler(TransferHandlerBase):
+    def handle_transfer(self, transfer):
+        if transfer.pipette_sample_volume < self.robot_settings.pipette_min_volume:
+            self.error("Too low sample volume", transfer)
+
+
+class ShouldNotBeReachedHandler(TransferHandlerBase):
+    supports_batch = True
+
+    def handle_transfers(self, transfers):
+        for transfer in transfers:
+            transfer.custom_command = "reached"
+        return [None] * len(transfers)
+
+
+class RobotWarningHandler(TransferHandlerBase):
+    def handle_transfer(self, transfer):
+        self.warning("Evaluated on {}".format(self.robot_settings.name), transfer)
+
+
+class TemporaryContainerSplitHandler(TransferSplitHandlerBase):
+    """Splits transfers with too low sample volume, diluting them in a temporary container first"""
+    def should_execute(self, transfer):
+        return transfer.pipette_sample_volume < self.robot_settings.pipette_min_volume
+
+    def temp_tag(self):
+        return "temp"
+
+    def main_tag(self):
+        return "default"
+
+    def _update_source_target_locations(self, dilute_session, original_transfer, temp_transfer, main_transfer):
+        container = dilute_session.get_temporary_container(original_transfer.target_location.container, "temp")
+        container.append(MagicMock())
+        temp_well = container.occupied[-1]
+        temp_transfer.source_location = original_transfer.source_location
+        temp_transfer.target_location = temp_well
+        main_transfer.source_location = temp_well
+        main_transfer.target_location = original_transfer.target_location
+        return temp_transfer, main_transfer
+
+
+class ThreadRecordingHandler(TransferHandlerBase):
+    threads = set()
+
+    def handle_transfer(self, transfer):
+        ThreadRecordingHandler.threads.add(threading.current_thread())
+
+
+def create_pairs():
+    helper = DilutionTestDataHelper(DilutionSettings.CONCENTRATION_REF_NM)
+    helper.create_dilution_pair(20, 40, 10, 20)
+    helper.create_dilution_pair(40, 40, 10, 20)
+    helper.create_dilution_pair(100, 40, 5, 20)
+    return helper.pairs
+
+
+class TestDilutionSession(unittest.TestCase):
+    def setUp(self):
+        SampleVolumeHandler.batch_calls = 0
+
+    def create_session(self, batch_mode=False, handlers=None, robots=None, robot_workers=1, debug_routes=False,
+                       incremental=False, stream_driver_files=False):
+        if handlers is None:
+            handlers = [MeasurementsHandler, SampleVolumeHandler, MinVolumeHandler]
+        if robots is None:
+            robots = [FakeRobotSettings()]
+        settings = DilutionSettings(concentration_ref="nM",
+                                    sort_strategy=lambda t: t.source_location.index_down_first)
+        return DilutionSession(MagicMock(), robots, settings, MagicMock(), MagicMock(),
+                               handlers, [], batch_mode=batch_mode, robot_workers=robot_workers,
+                               debug_routes=debug_routes, incremental=incremental,
+                               stream_driver_files=stream_driver_files)
+
+    def evaluate_driver_file(self, batch_mode):
+        session = self.create_session(batch_mode)
+        session.evaluate(create_pairs())
+        return session.transfer_batches("robot1").driver_files["default"].to_string()
+
+    def test_batch_mode_creates_the_same_driver_file(self):
+        self.assertEqual(self.evaluate_driver_file(False), self.evaluate_driver_file(True))
+
+    def test_batch_handler_is_called_once_per_robot(self):
+        session = self.create_session(True)
+        session.evaluate(create_pairs())
+        self.assertEqual(1, SampleVolumeHandler.batch_calls)
+
+    def test_batch_mode_stops_on_errors(self):
+        session = self.create_session(True, [MeasurementsHandler, SampleVolumeHandler, MinVolumeHandler,
+                                             ShouldNotBeReachedHandler])
+        session.evaluate(create_pairs())
+        transfers = list(session.transfer_batches("robot1")[0].transfers)
+        reached = sorted((t.pipette_sample_volume, t.custom_command) for t in transfers)
+        self.assertEqual([(1.0, None), (5.0, "reached"), (10.0, "reached")], reached)
+
+    def test_robots_evaluated_concurrently_create_the_same_driver_files(self):
+        def driver_files(robot_workers):
+            session = self.create_session(robots=[FakeRobotSettings(name) for name in ["c", "a", "b"]],
+                                          robot_workers=robot_workers)
+            session.evaluate(create_pairs())
+            return {name: session.transfer_batches(name).driver_files["default"].to_string()
+                    for name in ["a", "b", "c"]}
+        self.assertEqual(driver_files(1), driver_files(3))
+
+    def test_validation_results_are_pushed_in_robot_name_order(self):
+        session = self.create_session(handlers=[RobotWarningHandler],
+                                      robots=[FakeRobotSettings(name) for name in ["c", "a", "b"]],
+                                      robot_workers=3)
+        session.evaluate(create_pairs())
+        pushed = [call[0][0] for call in session.validation_service.handle_validation.call_args_list]
+        robots = [set(result.msg for result in results) for results in pushed]
+        self.assertEqual([{"Evaluated on a"}, {"Evaluated on b"}, {"Evaluated on c"}], robots)
+
+    def test_robots_are_evaluated_on_the_calling_thread_with_one_worker(self):
+        ThreadRecordingHandler.threads = set()
+        session = self.create_session(handlers=[ThreadRecordingHandler],
+                                      robots=[FakeRobotSettings(name) for name in ["c", "a", "b"]])
+        session.evaluate(create_pairs())
+        self.assertEqual({threading.current_thread()}, ThreadRecordingHandler.threads)
+
+    def test_robots_are_evaluated_on_worker_threads(self):
+        ThreadRecordingHandler.threads = set()
+        session = self.create_session(handlers=[ThreadRecordingHandler],
+                                      robots=[FakeRobotSettings(name) for name in ["c", "a", "b"]],
+                                      robot_workers=3)
+        session.evaluate(create_pairs())
+        self.assertNotIn(threading.current_thread(), ThreadRecordingHandler.threads)
+
+    def test_robots_split_into_temporary_containers_of_their_own(self):
+        handlers = [MeasurementsHandler, SampleVolumeHandler, [TemporaryContainerSplitHandler]]
+        session = self.create_session(handlers=handlers, robots=[FakeRobotSettings(name) for name in ["a", "b"]],
+                                      robot_workers=2)
+        session.evaluate(create_pairs())
+        containers = [session.temporary_containers_by_robot[name].values() for name in ["a", "b"]]
+        self.assertEqual([[1], [1]], [[len(container.occupied) for container in c] for c in containers])
+        self.assertIsNot(containers[0][0], containers[1][0])
+        self.assertEqual(*[sorted(session.transfer_batches(name).driver_files["temp"].to_string().split("\n"))
+                           for name in ["a", "b"]])
+
+    def evaluate_route(self, debug_routes):
+        session = self.create_session(debug_routes=debug_routes)
+        transfers = session.create_transfers_from_pairs(create_pairs())
+        handlers, _ = session.init_handlers(session.transfer_handler_types, [], session.dilution_settings,
+                                            session.robot_settings[0], VirtualTransferBatch(transfers))
+        return transfers[0], session.evaluate_transfer_route(transfers[0], handlers)
+
+    def test_route_nodes_share_the_transfer(self):
+        transfer, route = self.evaluate_route(debug_routes=False)
+        self.assertEqual({transfer}, set(node.transfer for node, level in route.walk()))
+        self.assertEqual([transfer], route.transfers)
+
+    def test_virtual_transfers_are_updated(self):
+        for batch_mode in [False, True]:
+            session = self.create_session(batch_mode)
+            session.evaluate(create_pairs())
+            transfers = sorted(session.transfer_batches("robot1")[0].transfers, key=lambda t: t.source_conc)
+            virtual_transfers = [utils.single(t.virtual_transfer.transfers) for t in transfers]
+            self.assertEqual([10.0, 5.0, 1.0], [t.pipette_sample_volume for t in virtual_transfers])
+            self.assertEqual([20, 40, 100], [t.source_conc for t in virtual_transfers])
+
+    def test_debug_routes_keep_a_copy_per_handler(self):
+        transfer, route = self.evaluate_route(debug_routes=True)
+        nodes = [node for node, level in route.walk()]
+        self.assertEqual(4, len(set(node.transfer for node in nodes)))
+        self.assertEqual([0, 10.0, 10.0, 10.0], [node.transfer.pipette_sample_volume for node in nodes])
+
+    def test_incremental_evaluation_reuses_unchanged_routes_and_driver_files(self):
+        session = self.create_session(incremental=True)
+        pairs = create_pairs()
+        session.evaluate(pairs)
+        driver_file = session.transfer_batches("robot1").driver_files["default"]
+        session.evaluate(pairs)
+        self.assertEqual(3, session.evaluation_caches["robot1"].evaluated_routes)
+        self.assertIs(driver_file, session.transfer_batches("robot1").driver_files["default"])
+
+    def test_incremental_evaluation_evaluates_changed_pairs(self):
+        session = self.create_session(incremental=True)
+        pairs = create_pairs()
+        session.evaluate(pairs)
+        pairs[1].input_artifact.udf_map["Conc. Current (nM)"] = 20
+        session.evaluate(pairs)
+
+        full_session = self.create_session()
+        full_session.evaluate(pairs)
+        self.assertEqual(4, session.evaluation_caches["robot1"].evaluated_routes)
+        self.assertEqual(full_session.transfer_batches("robot1").driver_files["default"].to_string(),
+                         session.transfer_batches("robot1").driver_files["default"].to_string())
+
+    def test_incremental_evaluation_drops_removed_pairs(self):
+        session = self.create_session(incremental=True)
+        pairs = create_pairs()
+        session.evaluate(pairs)
+        session.evaluate(pairs[1:])
+        self.assertEqual(2, len(session.transfer_batches("robot1")[0].transfers))
+
+    def test_incremental_evaluation_evaluates_all_pairs_when_settings_change(self):
+        session = self.create_session(incremental=True)
+        pairs = create_pairs()
+        session.evaluate(pairs)
+        session.robot_settings[0].header.append("Comment")
+        session.evaluate(pairs)
+        self.assertEqual(6, session.evaluation_caches["robot1"].evaluated_routes)
+        self.assertEqual("Source,Target,Sample,Buffer,Comment",
+                         session.transfer_batches("robot1").driver_files["default"].to_string().split("\n")[0])
+
+    def test_incremental_evaluation_of_split_pairs_starts_over_in_new_temporary_containers(self):
+        handlers = [MeasurementsHandler, SampleVolumeHandler, [TemporaryContainerSplitHandler]]
+        session = self.create_session(handlers=handlers, incremental=True)
+        pairs = create_pairs()
+        session.evaluate(pairs)
+        pairs[2].output_artifact.udf_map["Target vol. (ul)"] = 30
+        session.evaluate(pairs)
+
+        full_session = self.create_session(handlers=handlers)
+        full_session.evaluate(pairs)
+
+        def driver_file_rows(session):
+            # Transfers from the same source position can come in any order
+            return {name: sorted(driver_file.to_string().split("\n"))
+                    for name, driver_file in session.transfer_batches("robot1").driver_files.items()}
+        self.assertEqual(driver_file_rows(full_session), driver_file_rows(session))
+        temp_containers = session.temporary_containers_by_robot["robot1"].values()
+        self.assertEqual([1], [len(container.occupied) for container in temp_containers])
+
+    def test_incremental_evaluation_keeps_temporary_containers_per_robot(self):
+        handlers = [MeasurementsHandler, SampleVolumeHandler, [TemporaryContainerSplitHandler]]
+        session = self.create_session(handlers=handlers, robots=[FakeRobotSettings(name) for name in ["a", "b"]],
+                                      incremental=True)
+        pairs = create_pairs()
+        session.evaluate(pairs)
+        pairs[2].output_artifact.udf_map["Target vol. (ul)"] = 30
+        session.evaluate(pairs)
+        for name in ["a", "b"]:
+            cache = session.evaluation_caches[name]
+            self.assertIs(cache.temporary_containers, session.temporary_containers_by_robot[name])
+            temp_containers = set(cache.temporary_containers.values())
+            for route in cache.routes.values():
+                for transfer in route.transfers:
+                    if transfer.batch == "temp":
+                        self.assertIn(transfer.target_location.container, temp_containers)
+
+    def test_invalidate_evaluates_all_routes(self):
+        session = self.create_session(incremental=True)
+        pairs = create_pairs()
+        session.evaluate(pairs)
+        session.invalidate()
+        session.evaluate(pairs)
+        self.assertEqual(3, session.evaluation_caches["robot1"].evaluated_routes)
+
+    def test_streamed_driver_file_has_the_same_content(self):
+        session = self.create_session()
+        session.evaluate(create_pairs())
+        streamed_session = self.create_session(stream_driver_files=True)
+        streamed_session.evaluate(create_pairs())
+        csv = session.transfer_batches("robot1").driver_files["default"]
+        driver_file = streamed_session.transfer_batches("robot1").driver_files["default"]
+        self.assertEqual(csv.file_name, driver_file.file_name)
+        self.assertEqual(csv.to_string(), driver_file.to_string())
+
+    def test_driver_files_are_written_to_the_upload_queue(self):
+        session = self.create_session(stream_driver_files=True)
+        session.evaluate(create_pairs())
+        file_service = MagicMock()
+        stream = StringIO()
+        file_service.open_upload.return_value.__enter__.return_value = stream
+        transfer_batches = session.transfer_batches("robot1")
+        transfer_batches.upload_driver_files(file_service, "Driver File")
+        driver_file = transfer_batches.driver_files["default"]
+        file_service.open_upload.assert_called_once_with("Driver File", driver_file.file_name,
+                                                         FileService.FILE_PREFIX_ARTIFACT_ID)
+        self.assertEqual(driver_file.to_string(), stream.getvalue())
+
+
+class TestTransferBatchCollection(unittest.TestCase):
+    def create_transfers(self):
+        session = DilutionSession(MagicMock(), [], DilutionSettings(), MagicMock(), MagicMock(), [], [])
+        return session.create_transfers_from_pairs(create_pairs())
+
+    def test_iteration_order_is_sorted_once(self):
+        collection = TransferBatchCollection(lambda batch: batch.name,
+                                             TransferBatch([], name="b"), TransferBatch([], name="a"))
+        self.assertEqual(["a", "b"], [batch.name for batch in collection])
+        self.assertEqual(["a", "b"], [batch.name for batch in collection])
+        self.assertEqual((1, 1), (collection.sorts, collection.avoided_sorts))
+
+    def test_append_invalidates_iteration_order(self):
+        collection = TransferBatchCollection(lambda batch: batch.name, TransferBatch([], name="b"))
+        list(collection)
+        collection.append(TransferBatch([], name="a"))
+        self.assertEqual(["a", "b"], [batch.name for batch in collection])
+        self.assertEqual((2, 0), (collection.sorts, collection.avoided_sorts))
+
+    def test_transfers_by_target_analyte_is_invalidated_by_appending_transfers(self):
+        transfers = self.create_transfers()
+        batch = TransferBatch(transfers[:2], name="default")
+        collection = TransferBatchCollection(lambda b: b.name, batch)
+        self.assertEqual(2, len(DilutionSession.group_transfers_by_target_analyte(collection)))
+        self.assertEqual(2, len(DilutionSession.group_transfers_by_target_analyte(collection)))
+        batch.append(transfers[2])
+        self.assertEqual(3, len(DilutionSession.group_transfers_by_target_analyte(collection)))
+
+    def test_append_invalidates_transfers_by_output(self):
+        transfers = self.create_transfers()
+        batch = TransferBatch(transfers[:2])
+        self.assertEqual(2, len(batch.transfers_by_output))
+        batch.append(transfers[2])
+        self.assertEqual(3, len(batch.transfers_by_output))
+        self.assertEqual(3, len(list(batch.virtual_transfers())))
+        self.assertEqual(1, batch.avoided_sorts)
+
+    def test_invalidate_sorts_renamed_batches_again(self):
+        batch = TransferBatch([], name="a")
+        collection = TransferBatchCollection(lambda b: b.name, batch, TransferBatch([], name="b"))
+        list(collection)
+        batch.name = "c"
+        collection.invalidate()
+        self.assertEqual(["b", "c"], [b.name for b in collection])
+        self.assertEqual((2, 0), (collection.sorts, collection.avoided_sorts))
+
+    def test_invalidate_groups_changed_transfers_again(self):
+        transfers = self.create_transfers()
+        batch = TransferBatch(transfers[:2], name="default")
+        collection = TransferBatchCollection(lambda b: b.name, batch)
+        self.assertEqual(2, len(DilutionSession.group_transfers_by_target_analyte(collection)))
+        transfers[1].target_location = transfers[0].target_location
+        batch.transfers.append(transfers[2])
+        batch.invalidate()
+        grouped = DilutionSession.group_transfers_by_target_analyte(collection)
+        self.assertEqual([2, 1], sorted((len(t) for t in grouped.values()), reverse=True))
+        self.assertEqual(2, len(batch.transfers_by_output))
+
+    def test_returned_groups_do_not_change_the_cache(self):
+        transfers = self.create_transfers()
+        batch = TransferBatch(transfers[:2], name="default")
+        collection = TransferBatchCollection(lambda b: b.name, batch)
+        batch.transfers_by_output.clear()
+        DilutionSession.group_transfers_by_target_analyte(collection).clear()
+        self.assertEqual(2, len(batch.transfers_by_output))
+        self.assertEqual(2, len(DilutionSession.group_transfers_by_target_analyte(collection)))
@@ -95,6 +95,19 @@ class TestArtifact(unittest.TestCase):
         self.assertEqual(expected_analyte.well.artifact.name,
                          analyte.well.artifact.name)
 
+    def test_same_sample_in_two_analytes_is_created_once(self):
+        clarity_mapper = ClarityMapper()
+        analytes = list()
+        for artifact_id, well_position in [("art1", "A:1"), ("art2", "B:1")]:
+            api_resource = mock_artifact_resource(
+                resouce_id=artifact_id, sample_name="sample1", well_position=well_position)
+            api_resource.udf = {}
+            analytes.append(clarity_mapper.analyte_create_object(
+                api_resource, is_input=True, container_repo=mock_container_repo(container_id="cont1"),
+                process_type=MagicMock()))
+
+        self.assertIs(analytes[0].samples[0], analytes[1].samples[0])
+
     def _create_process_type_mock(self, per_input_artifact_type="ResultFile",
                                   output_generation_type="PerInput",
                                   field_definitions=None):
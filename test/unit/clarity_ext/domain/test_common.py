@@ -0,0 +1,20 @@
+import unittest
+from test.unit.clarity_ext import helpers
+
+
+class TestDomainObjectEquality(unittest.TestCase):
+
+    def test_equal_analytes_with_circular_references(self):
+        a = helpers.fake_analyte("cont-id1", "art-id1", "sample1", "art-name1", "A:1", True, udfs={"Volume": 10})
+        b = helpers.fake_analyte("cont-id1", "art-id1", "sample1", "art-name1", "A:1", True, udfs={"Volume": 10})
+        self.assertEqual(a, b)
+        b.udf_volume = 20
+        self.assertNotEqual(a, b)
+
+    def test_shallow_equality_compares_nested_objects_by_id(self):
+        a = helpers.fake_analyte("cont-id1", "art-id1", "sample1", "art-name1", "A:1", True)
+        b = helpers.fake_analyte("cont-id1", "art-id1", "sample1", "art-name1", "A:1", True)
+        b.container.name = "Renamed"
+        self.assertNotEqual(a.container, b.container)
+        self.assertTrue(a.container.equals(b.container, max_depth=0))
+        self.assertFalse(a.container.equals(b.container, max_depth=1))
@@ -1,5 +1,5 @@
 import unittest
-from clarity_ext.domain.udf import UdfMapping
+from clarity_ext.domain.udf import UdfMapping, UdfInfo, UdfSchema
 from clarity_ext.domain import ResultFile, Analyte, SharedResultFile, Process
 from clarity_ext.domain.udf import UdfMappingNotUniqueException
 
@@ -23,6 +23,49 @@ class TestUdfMappingInfo(unittest.TestCase):
         mapping.unwrap("% Total").value = 20
         self.assertTrue(mapping.unwrap("% Total").is_dirty())
 
+    def test_updated_udfs_are_tracked_on_assignment(self):
+        mapping = UdfMapping({"Custom #1": 10, "Custom #2": 20, "Custom #3": 30})
+        mapping["udf_custom_1"] = 11
+        mapping["Custom #2"] = 21
+        mapping["Custom #2"] = 20
+        self.assertEqual(["Custom #1"], [udf.key for udf in mapping.enumerate_updated()])
+        self.assertEqual(1, mapping.updated_count())
+
+    def test_mappings_with_same_udfs_share_schema(self):
+        first = UdfMapping({"Custom #1": 10, "Custom #2": 20})
+        second = UdfMapping({"Custom #2": 21, "Custom #1": 11})
+        self.assertIs(first.schema, second.schema)
+        self.assertEqual(11, second.get_value("udf_custom_1"))
+        second.add("Custom #3", 30)
+        self.assertIsNot(first.schema, second.schema)
+        self.assertFalse("Custom #3" in first)
+        self.assertEqual(30, second["udf_custom_3"].value)
+
+    def test_udf_info_can_be_created_from_key_and_value(self):
+        udf_info = UdfInfo("Custom #1", 10)
+        self.assertEqual(("Custom #1", 10, False), (udf_info.key, udf_info.value, udf_info.is_dirty()))
+        udf_info.value = 11
+        self.assertTrue(udf_info.is_dirty())
+
+    def test_views_are_kept_until_udfs_are_added(self):
+        mapping = UdfMapping({"Custom #1": 10, "Custom #2": 20})
+        self.assertIs(mapping.raw_map, mapping.raw_map)
+        self.assertIs(mapping.values, mapping.values)
+        self.assertIs(mapping.raw_map["udf_custom_1"][0], mapping.raw_map["Custom #1"][0])
+        mapping["Custom #1"] = 11
+        self.assertEqual(11, mapping.raw_map["Custom #1"][0].value)
+        mapping.add("Custom #3", 30)
+        self.assertEqual(30, mapping.raw_map["udf_custom_3"][0].value)
+        self.assertEqual(3, len(mapping.values))
+
+    def test_schemas_are_not_shared_after_max_cached(self):
+        max_cached = UdfSchema.MAX_CACHED
+        UdfSchema.MAX_CACHED = 0
+        try:
+            self.assertIsNot(UdfSchema.get(["Not cached"]), UdfSchema.get(["Not cached"]))
+        finally:
+            UdfSchema.MAX_CACHED = max_cached
+
     def test_udf_mapping_dictionary_like(self):
         mapping = UdfMapping({"Custom #1": 10, "Custom #2": 20})
 
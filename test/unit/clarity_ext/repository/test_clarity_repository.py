@@ -0,0 +1,73 @@
+import unittest
+from mock import MagicMock
+from clarity_ext.repository.clarity_repository import ClarityRepository, BatchUpdateException
+from clarity_ext.repository.step_repository import StepRepository
+
+
+class TestClarityRepository(unittest.TestCase):
+
+    def test_resources_are_updated_in_batches(self):
+        lims = MagicMock()
+        resources = [FakeResource(lims, i) for i in range(5)]
+        ClarityRepository().update_batch(resources, batch_size=2)
+        self.assertEqual([[0, 1], [2, 3], [4]],
+                         [[r.id for r in call[0][0]] for call in lims.put_batch.call_args_list])
+        self.assertFalse(any(r.put.called for r in resources))
+
+    def test_failed_batch_is_retried_one_at_a_time_and_failures_reported(self):
+        lims = MagicMock()
+        lims.put_batch.side_effect = Exception("Batch failed")
+        resources = [FakeResource(lims, i) for i in range(3)]
+        resources[1].put.side_effect = Exception("Invalid UDF value")
+        with self.assertRaises(BatchUpdateException) as context:
+            ClarityRepository().update_batch(resources)
+        self.assertEqual([resources[1]], [resource for resource, _ in context.exception.failures])
+        self.assertTrue(resources[2].put.called)
+
+    def test_resources_with_the_same_uri_are_updated_once(self):
+        lims = MagicMock()
+        resources = [FakeResource(lims, i) for i in [0, 1, 0]]
+        ClarityRepository().update_batch(resources)
+        self.assertEqual([[resources[2], resources[1]]],
+                         [call[0][0] for call in lims.put_batch.call_args_list])
+
+
+class TestStepRepository(unittest.TestCase):
+
+    def test_containers_are_prefetched_in_one_batch(self):
+        plate_type = FakeResource(None, "plate")
+        containers = [FakeResource(None, "27-{}".format(i)) for i in range(2)]
+        for container in containers:
+            container.type = plate_type
+        inputs = [create_artifact("2-{}".format(i), containers[0]) for i in range(2)]
+        outputs = [create_artifact("92-{}".format(i), containers[1]) for i in range(2)]
+        outputs.append(create_artifact("92-shared", None))
+        session = MagicMock()
+        session.current_step.api_resource.input_output_maps = [
+            ({"uri": input}, {"uri": output}) for input, output in zip(inputs + inputs[:1], outputs)]
+        session.api.get_batch.side_effect = list
+
+        StepRepository(session, MagicMock()).prefetch()
+
+        # One batch call each for the artifacts, the containers and the samples:
+        self.assertEqual(3, session.api.get_batch.call_count)
+        self.assertEqual(sorted(containers, key=lambda c: c.id),
+                         sorted(session.api.get_batch.call_args_list[1][0][0], key=lambda c: c.id))
+        self.assertFalse(any(container.get.called for container in containers))
+        plate_type.get.assert_called_once_with()
+
+
+def create_artifact(id, container):
+    artifact = FakeResource(None, id)
+    artifact.location = (container, "A:1") if container else None
+    artifact.samples = []
+    return artifact
+
+
+class FakeResource(object):
+    def __init__(self, lims, id):
+        self.lims = lims
+        self.id = id
+        self.uri = "http://lims/api/v2/fakes/{}".format(id)
+        self.get = MagicMock()
+        self.put = MagicMock()
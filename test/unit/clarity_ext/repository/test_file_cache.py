@@ -0,0 +1,62 @@
+import os
+import time
+import shutil
+import tempfile
+import unittest
+from clarity_ext.repository.file_cache import FileCache
+
+
+class TestFileCache(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.cache = FileCache(os.path.join(self.dir, "cache"), "https://lims", max_bytes=10)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_files_with_same_content_share_blob(self):
+        self.cache.put("40-1", self._file("a", "abcd"), "digest", "sftp://lims/1")
+        self.cache.put("40-2", self._file("b", "abcd"), "digest", "sftp://lims/2")
+        self.assertEqual(os.listdir(self.cache.blobs_dir), ["digest"])
+        self.assertEqual(self.cache.get("40-2", os.path.join(self.dir, "out"), "sftp://lims/2"), "digest")
+
+    def test_least_recently_used_is_evicted(self):
+        self.cache.put("40-1", self._file("a", "123456"), "first", "sftp://lims/1")
+        os.utime(os.path.join(self.cache.blobs_dir, "first"), (time.time() - 60, time.time() - 60))
+        self.cache.put("40-2", self._file("b", "123456"), "second", "sftp://lims/2")
+        self.assertIsNone(self.cache.get("40-1", os.path.join(self.dir, "out"), "sftp://lims/1"))
+        self.assertEqual(self.cache.get("40-2", os.path.join(self.dir, "out"), "sftp://lims/2"), "second")
+
+    def test_entries_of_evicted_blobs_are_removed(self):
+        staging = FileCache(os.path.join(self.dir, "cache"), "https://lims-staging", max_bytes=10)
+        staging.put("40-1", self._file("a", "123456"), "first", "sftp://lims-staging/1")
+        self.cache.put("40-1", self._file("b", "123456"), "first", "sftp://lims/1")
+        os.utime(os.path.join(self.cache.blobs_dir, "first"), (time.time() - 60, time.time() - 60))
+        self.cache.put("40-2", self._file("c", "123456"), "second", "sftp://lims/2")
+        self.assertEqual(["40-2"], os.listdir(self.cache.ids_dir))
+        self.assertEqual([], os.listdir(staging.ids_dir))
+
+    def test_servers_sharing_a_file_id_have_separate_entries(self):
+        staging = FileCache(os.path.join(self.dir, "cache"), "https://lims-staging")
+        staging.put("40-123", self._file("a", "staging"), "staging-digest", "sftp://lims-staging/1")
+        production = FileCache(os.path.join(self.dir, "cache"), "https://lims")
+        out = os.path.join(self.dir, "out")
+        self.assertIsNone(production.get("40-123", out, "sftp://lims-staging/1"))
+        production.put("40-123", self._file("b", "prod"), "prod-digest", "sftp://lims/1")
+        self.assertEqual(staging.get("40-123", out, "sftp://lims-staging/1"), "staging-digest")
+        self.assertEqual(production.get("40-123", out, "sftp://lims/1"), "prod-digest")
+        self.assertEqual(open(out).read(), "prod")
+
+    def test_entry_not_matching_the_server_is_not_used(self):
+        self.cache.put("40-1", self._file("a", "abcd"), "digest", "sftp://lims/1")
+        out = os.path.join(self.dir, "out")
+        self.assertIsNone(self.cache.get("40-1", out, "sftp://lims/other"))
+        self.assertIsNone(self.cache.get("40-1", out))
+        self.assertEqual(self.cache.get("40-1", out, checksum="DIGEST"), "digest")
+
+    def _file(self, name, content):
+        path = os.path.join(self.dir, name)
+        with open(path, "w") as f:
+            f.write(content)
+        return path
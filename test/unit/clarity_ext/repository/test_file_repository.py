@@ -0,0 +1,81 @@
+import os
+import shutil
+import hashlib
+import tempfile
+import unittest
+from clarity_ext.repository.file_repository import FileRepository, DownloadChecksumError
+from clarity_ext.repository.file_cache import FileCache
+
+
+class TestFileRepository(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.local_path = os.path.join(self.dir, "file.txt")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_download_is_streamed_in_chunks(self):
+        session = FakeSession("abcdefghij")
+        repo = FileRepository(session, chunk_size=3)
+        checksum = repo.copy_remote_file("92-1", self.local_path)
+        self.assertEqual(open(self.local_path).read(), "abcdefghij")
+        self.assertEqual(session.response.chunks, ["abc", "def", "ghi", "j"])
+        self.assertEqual(session.kwargs, {"stream": True})
+        self.assertEqual(checksum, hashlib.md5("abcdefghij").hexdigest())
+        self.assertTrue(session.response.closed)
+
+    def test_checksum_mismatch_leaves_no_file(self):
+        repo = FileRepository(FakeSession("abc"))
+        with self.assertRaises(DownloadChecksumError):
+            repo.copy_remote_file("92-1", self.local_path, checksum="0" * 32)
+        self.assertEqual(os.listdir(self.dir), [])
+
+    def test_repeated_download_is_served_from_cache(self):
+        cache = FileCache(os.path.join(self.dir, "cache"), "https://lims")
+        FileRepository(FakeSession("abc"), cache=cache).copy_remote_file(
+            "92-1", self.local_path, content_location="sftp://lims/1")
+        session = FakeSession("abc")
+        other_path = os.path.join(self.dir, "other.txt")
+        FileRepository(session, cache=cache).copy_remote_file("92-1", other_path, content_location="sftp://lims/1")
+        self.assertEqual(open(other_path).read(), "abc")
+        self.assertIsNone(session.kwargs)
+
+    def test_file_with_new_content_location_is_downloaded(self):
+        cache = FileCache(os.path.join(self.dir, "cache"), "https://lims")
+        FileRepository(FakeSession("abc"), cache=cache).copy_remote_file(
+            "92-1", self.local_path, content_location="sftp://lims/1")
+        session = FakeSession("def")
+        other_path = os.path.join(self.dir, "other.txt")
+        FileRepository(session, cache=cache).copy_remote_file("92-1", other_path, content_location="sftp://lims/2")
+        self.assertEqual(open(other_path).read(), "def")
+
+
+class FakeResponse(object):
+    def __init__(self, content):
+        self.content = content
+        self.chunks = list()
+        self.closed = False
+
+    def raise_for_status(self):
+        pass
+
+    def iter_content(self, chunk_size=1):
+        for i in range(0, len(self.content), chunk_size):
+            chunk = self.content[i:i + chunk_size]
+            self.chunks.append(chunk)
+            yield chunk
+
+    def close(self):
+        self.closed = True
+
+
+class FakeSession(object):
+    def __init__(self, content):
+        self.response = FakeResponse(content)
+        self.kwargs = None
+
+    def get(self, endpoint, **kwargs):
+        self.kwargs = kwargs
+        return self.response
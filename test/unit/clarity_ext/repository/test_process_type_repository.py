@@ -0,0 +1,73 @@
+import os
+import unittest
+import shutil
+import tempfile
+import threading
+from mock import patch
+import xml.etree.ElementTree as ET
+from clarity_ext.repository.process_type_repository import ProcessTypeRepository
+
+
+class TestProcessTypeRepository(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def test_process_type_is_fetched_once_between_runs(self):
+        resource = FakeProcessTypeResource()
+        first = ProcessTypeRepository(self.cache_dir).get_process_type(resource)
+        second = ProcessTypeRepository(self.cache_dir).get_process_type(resource)
+
+        self.assertEqual(1, resource.get_calls)
+        self.assertEqual(["Conc", "Vol"], second.process_outputs[0].field_definitions)
+        self.assertEqual(first.name, second.name)
+
+    def test_expired_process_type_is_fetched_again(self):
+        resource = FakeProcessTypeResource()
+        ProcessTypeRepository(self.cache_dir).get_process_type(resource)
+        ProcessTypeRepository(self.cache_dir, ttl=-1).get_process_type(resource)
+        self.assertEqual(2, resource.get_calls)
+
+    def test_process_type_is_cached_in_memory_without_cache_dir(self):
+        resource = FakeProcessTypeResource()
+        repo = ProcessTypeRepository()
+        repo.get_process_type(resource)
+        repo.get_process_type(resource)
+        self.assertEqual(1, resource.get_calls)
+
+    def test_process_type_that_cant_be_pickled_is_not_cached(self):
+        for unpicklable in [lambda: None, threading.Lock()]:
+            process_type = UnpicklableProcessType(unpicklable)
+            with patch("clarity_ext.repository.process_type_repository.ProcessType.create_from_resource",
+                       return_value=process_type):
+                ret = ProcessTypeRepository(self.cache_dir).get_process_type(FakeProcessTypeResource())
+            self.assertIs(process_type, ret)
+            self.assertEqual([], os.listdir(self.cache_dir))
+
+
+class UnpicklableProcessType(object):
+    def __init__(self, value):
+        self.value = value
+
+
+class FakeProcessTypeResource(object):
+    def __init__(self):
+        self.uri = "http://lims/api/v2/processtypes/1"
+        self.id = "1"
+        self.name = "Dilution"
+        self.get_calls = 0
+        self.root = ET.fromstring("""
+            <process-type>
+                <process-output>
+                    <artifact-type>Analyte</artifact-type>
+                    <output-generation-type>PerInput</output-generation-type>
+                    <field-definition name="Conc"/>
+                    <field-definition name="Vol"/>
+                </process-output>
+            </process-type>""")
+
+    def get(self):
+        self.get_calls += 1
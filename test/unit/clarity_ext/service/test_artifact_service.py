@@ -1,7 +1,34 @@
+import threading
 import unittest
-from mock import MagicMock
+from mock import MagicMock, patch
 from test.unit.clarity_ext import helpers
 from clarity_ext.service import ClarityService, ArtifactService
+from clarity_ext.mappers.clarity_mapper import ClarityMapper
+
+
+class FakeParentStepRepository(object):
+    """A step repository for a parent step, wrapping samples through a mapper shared between steps"""
+
+    def __init__(self, clarity_mapper, sample_ids):
+        self.clarity_mapper = clarity_mapper
+        self.sample_ids = sample_ids
+        self.prefetch_threads = list()
+        self.wrap_threads = list()
+
+    def prefetch(self):
+        self.prefetch_threads.append(threading.current_thread())
+
+    def all_artifacts(self):
+        self.wrap_threads.append(threading.current_thread())
+        ret = list()
+        for sample_id in self.sample_ids:
+            resource = MagicMock(id=sample_id, project=None, udf=dict())
+            resource.name = sample_id
+            input = helpers.fake_analyte("cont-id1", "in-" + sample_id, sample_id, sample_id, "A:1", True)
+            output = helpers.fake_analyte("cont-id2", "out-" + sample_id, sample_id, sample_id, "A:1", False)
+            input.samples = output.samples = [self.clarity_mapper.sample_create_object(resource)]
+            ret.append((input, output))
+        return ret
 
 
 class TestArtifactService(unittest.TestCase):
@@ -22,6 +49,29 @@ class TestArtifactService(unittest.TestCase):
         actual = set([x.id for x in svc.all_input_containers()])
         self.assertEqual(expected, actual)
 
+    def test_artifacts_by_container_and_id(self):
+        svc = helpers.mock_two_containers_artifact_service()
+
+        self.assertEqual(["art-id1", "art-id3"], [x.id for x in svc.output_artifacts_in_container("cont-id3")])
+        self.assertEqual(["art-id2", "art-id3", "art-id4"],
+                         [x.id for x in svc.input_artifacts_in_container("cont-id2")])
+        # The same id refers to different artifacts as input and output:
+        self.assertTrue(svc.input_artifact_by_id("art-id1").is_input)
+        self.assertFalse(svc.output_artifact_by_id("art-id1").is_input)
+
+    def test_accessors_share_one_snapshot_until_refreshed(self):
+        repo = MagicMock()
+        repo.all_artifacts = MagicMock(side_effect=helpers.two_containers_artifact_set)
+        svc = ArtifactService(repo)
+        svc.all_aliquot_pairs()
+        svc.all_analyte_pairs()
+        svc.all_output_containers()
+        self.assertEqual(1, repo.all_artifacts.call_count)
+        svc.refresh()
+        svc.all_aliquot_pairs()
+        self.assertEqual(2, repo.all_artifacts.call_count)
+        self.assertEqual(2, svc.repository_hits)
+
     def test_input_output_are_in_correct_order(self):
         # Ensures that the service returns tuples of input, output pairs in
         # order
@@ -65,3 +115,30 @@ class TestArtifactService(unittest.TestCase):
         clarity_svc = ClarityService(MagicMock(), MagicMock(), MagicMock())
         clarity_svc.update([outp])
         clarity_svc.step_repository.update_artifacts.assert_called_once()
+
+    def test_parent_steps_fetched_concurrently_share_sample_objects(self):
+        mapper = ClarityMapper()
+        parent_repos = {"process1": FakeParentStepRepository(mapper, ["sample1", "sample2"]),
+                        "process2": FakeParentStepRepository(mapper, ["sample2", "sample3"])}
+        repo = MagicMock()
+        repo.all_artifacts = helpers.two_containers_artifact_set
+        svc = ArtifactService(repo, parent_step_workers=2)
+        processes = [MagicMock(id="process1"), MagicMock(id="process2")]
+        for ix, (input, output) in enumerate(svc.all_artifacts()):
+            input.parent_process = processes[ix % 2]
+            output.input = input
+
+        with patch.object(ArtifactService, "_step_artifact_service",
+                          lambda self, process: ArtifactService(parent_repos[process.id])):
+            inputs = list(svc.parent_input_artifacts())
+
+        samples_by_id = dict()
+        for input in inputs:
+            for sample in input.samples:
+                samples_by_id.setdefault(sample.id, set()).add(sample)
+        self.assertEqual({"sample1": 1, "sample2": 1, "sample3": 1},
+                         {sample_id: len(samples) for sample_id, samples in samples_by_id.items()})
+        # Only fetching is done by the workers, the domain objects are created on the calling thread:
+        for parent_repo in parent_repos.values():
+            self.assertEqual([threading.current_thread()], parent_repo.wrap_threads)
+            self.assertEqual(1, len(parent_repo.prefetch_threads))
@@ -0,0 +1,40 @@
+import unittest
+from mock import MagicMock
+from clarity_ext.domain import Container
+from clarity_ext.domain.udf import UdfMapping
+from clarity_ext.repository import ClarityRepository
+from clarity_ext.service import ClarityService
+
+
+class TestClarityService(unittest.TestCase):
+
+    def test_changed_containers_are_updated_in_batches(self):
+        lims = MagicMock()
+        containers = [create_container(lims, i, renamed=i != 1) for i in range(4)]
+        clarity_svc = ClarityService(ClarityRepository(), MagicMock(), MagicMock(), batch_size=2)
+        clarity_svc.update(containers + [containers[0]])
+        self.assertEqual([[containers[0].api_resource, containers[2].api_resource], [containers[3].api_resource]],
+                         [call[0][0] for call in lims.put_batch.call_args_list])
+        self.assertFalse(any(container.api_resource.put.called for container in containers))
+
+    def test_no_batch_update_when_commits_are_ignored(self):
+        lims = MagicMock()
+        clarity_svc = ClarityService(ClarityRepository(), MagicMock(), MagicMock())
+        clarity_svc.update([create_container(lims, 0, renamed=True)], ignore_commit=True)
+        self.assertFalse(lims.put_batch.called)
+
+
+def create_container(lims, ix, renamed):
+    container = Container(container_type=Container.CONTAINER_TYPE_96_WELLS_PLATE, container_id="27-{}".format(ix),
+                          name="cont{}".format(ix), udf_map=UdfMapping())
+    container.api_resource = FakeContainerResource(lims, ix, "old" if renamed else container.name)
+    return container
+
+
+class FakeContainerResource(object):
+    def __init__(self, lims, ix, name):
+        self.lims = lims
+        self.uri = "http://lims/api/v2/containers/27-{}".format(ix)
+        self.name = name
+        self.udf = dict()
+        self.put = MagicMock()
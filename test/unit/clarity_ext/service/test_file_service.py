@@ -1,7 +1,14 @@
+import io
+import sys
+import traceback
 import unittest
+import requests
+from requests.packages.urllib3.exceptions import MaxRetryError, NewConnectionError
 from mock import MagicMock
 from clarity_ext.domain.artifact import Artifact
-from clarity_ext.service.file_service import FileService
+from cStringIO import StringIO
+from clarity_ext.service.file_service import FileService, Csv
+from clarity_ext.extensions import DriverFileExtension
 
 
 class TestUploadFileService(unittest.TestCase):
@@ -21,6 +28,147 @@ class TestUploadFileService(unittest.TestCase):
         os_service.copy_file.assert_called_with(
             "./context_files/temp/file2.txt", "./context_files/upload_queue/art2/art2_file2.txt")
 
+    def test_open_upload_writes_to_upload_queue(self):
+        artifact_service = MagicMock()
+        artifact_service.shared_files = MagicMock(return_value=[fake_artifact("art2", "Handle Name 2")])
+        os_service = MagicMock()
+        file_service = FileService(artifact_service, MagicMock(), False, os_service, session=MagicMock())
+        with file_service.open_upload("Handle Name 2", "file2.txt", FileService.FILE_PREFIX_ARTIFACT_ID) as f:
+            f.write("content")
+        os_service.open_file.assert_called_with("./context_files/upload_queue/art2/art2_file2.txt", "wb")
+        os_service.open_file.return_value.__enter__.return_value.write.assert_called_with("content")
+
+    def test_driver_file_extension_write_is_the_same_as_to_string(self):
+        for content in (["Name,Volume", u"sample\xe5,1.5"], u"Name,Volume\r\nsample\xe5,1.5"):
+            extension = FakeDriverFileExtension(content)
+            stream = StringIO()
+            extension.write(stream)
+            self.assertEqual(extension.to_string().encode("utf-8"), stream.getvalue())
+
+    def test_csv_write_is_the_same_as_to_string(self):
+        csv = Csv(delim="\t", newline="\r\n")
+        csv.set_header(["Name", "Volume"])
+        csv.append(["sample1", 1.5])
+        csv.append([u"sample2", 2])
+        stream = StringIO()
+        csv.write(stream)
+        self.assertEqual(csv.to_string(), stream.getvalue())
+
+    def test_csv_is_read_like_splitting_each_line(self):
+        content = "Well;Conc;Comment\r\nA:1;1.5;\"a\"\r\n\r\nB:1 ;;x \r\n"
+        csv = Csv(StringIO(content), delim=";")
+        self.assertEqual(["Well", "Conc", "Comment"], csv.header)
+        self.assertEqual([line.strip().split(";") for line in content.splitlines()[1:]],
+                         [line.values for line in csv])
+
+    def test_csv_converts_types_and_reads_quoted_values(self):
+        csv = Csv(StringIO('Well,Conc,Comment\nA:1,1.5,"a, b"\nB:1,,c\n'), types={"Conc": float}, quoted=True)
+        self.assertEqual([1.5, None], csv.column("Conc"))
+        self.assertEqual({"Well": ["A:1", "B:1"], "Conc": [1.5, None], "Comment": ["a, b", "c"]}, csv.columns())
+        self.assertEqual("a, b", csv.data[0]["Comment"])
+
+    def test_csv_lines_are_read_lazily(self):
+        lines = Csv.iter_lines(StringIO("Well,Conc\nA:1,1\nB:1,2"), types={"Conc": int})
+        self.assertEqual(1, next(lines)["Conc"])
+        self.assertEqual([2], [line["Conc"] for line in lines])
+
+    def test_csv_appends_after_lines_read(self):
+        csv = Csv(StringIO("Well,Conc\nA:1,1"))
+        csv.append(["B:1", "2"])
+        self.assertEqual("Well,Conc\nA:1,1\nB:1,2", csv.to_string())
+
+    def test_csv_reads_unicode_streams(self):
+        csv = Csv(io.StringIO(u"Well,Sample\nA:1,pr\xf6v 1\n"))
+        self.assertEqual([u"pr\xf6v 1"], csv.column("Sample"))
+
+    def test_csv_reads_utf16_exports_like_splitting_each_line(self):
+        content = u"Well,Conc\r\nA:1,1.5\r\nB:1,2\r\n".encode("utf-16")
+        csv = Csv(StringIO(content))
+        self.assertEqual([line.strip().split(",") for line in StringIO(content)][1:],
+                         [line.values for line in csv])
+
+    def test_csv_data_can_be_replaced(self):
+        csv = Csv(StringIO("Well,Conc\nA:1,1\nB:1,2"))
+        csv.data = [line for line in csv.data if line["Conc"] != "1"]
+        self.assertEqual(["2"], csv.column("Conc"))
+        self.assertEqual("Well,Conc\nB:1,2", csv.to_string())
+
+    def test_commit_retries_uploads_that_failed_to_connect(self):
+        file_service, session = self._file_service_with_queue({"art1": ["a.txt"], "art2": ["b.txt"]})
+        refused = requests.ConnectionError(MaxRetryError(None, "/api/v2/glsstorage",
+                                                         NewConnectionError(None, "Connection refused")))
+        session.api.upload_new_file.side_effect = [refused, None, None]
+        file_service.commit(disable_commits=False)
+        self.assertEqual(session.api.upload_new_file.call_count, 3)
+
+    def test_commit_does_not_retry_uploads_that_reached_the_server(self):
+        file_service, session = self._file_service_with_queue({"art1": ["a.txt"]})
+        session.api.upload_new_file.side_effect = [requests.ConnectionError("Connection reset by peer"),
+                                                   requests.HTTPError("500: Internal server error")]
+        with self.assertRaises(requests.ConnectionError):
+            file_service.commit(disable_commits=False)
+        self.assertEqual(session.api.upload_new_file.call_count, 1)
+
+    def test_commit_keeps_the_traceback_of_the_failed_upload(self):
+        file_service, session = self._file_service_with_queue({"art1": ["a.txt"]})
+        session.api.upload_new_file.side_effect = requests.HTTPError("400: Bad request")
+        try:
+            file_service.commit(disable_commits=False)
+        except requests.HTTPError:
+            functions = [frame[2] for frame in traceback.extract_tb(sys.exc_info()[2])]
+        self.assertIn("_upload_with_retry", functions)
+
+    def test_commit_uploads_the_files_of_an_artifact_in_queue_order(self):
+        file_service, session = self._file_service_with_queue({"art1": ["a.txt", "b.txt", "c.txt"],
+                                                               "art2": ["d.txt"]})
+        file_service.upload_workers = 2
+        file_service.commit(disable_commits=False)
+        uploaded = [call[0][1].split("/")[-1] for call in session.api.upload_new_file.call_args_list]
+        self.assertEqual(["a.txt", "b.txt", "c.txt"], [name for name in uploaded if name != "d.txt"])
+
+    def test_commit_raises_first_failure_after_all_uploads(self):
+        file_service, session = self._file_service_with_queue({"art1": ["a.txt"], "art2": ["b.txt"]})
+        session.api.upload_new_file.side_effect = [requests.HTTPError("400: Bad request"), None]
+        with self.assertRaises(requests.HTTPError):
+            file_service.commit(disable_commits=False)
+        self.assertEqual(session.api.upload_new_file.call_count, 2)
+
+    def test_commit_ignores_under_review_errors(self):
+        file_service, session = self._file_service_with_queue({"art1": ["a.txt"]})
+        session.api.upload_new_file.side_effect = requests.HTTPError("400: UNDER_REVIEW")
+        file_service.commit(disable_commits=False)
+
+    def _file_service_with_queue(self, files_by_artifact_id):
+        artifact_service = MagicMock()
+        artifact_service.shared_files = MagicMock(return_value=[
+            fake_artifact(artifact_id, "Handle") for artifact_id in files_by_artifact_id])
+        os_service = MagicMock()
+        os_service.listdir.side_effect = lambda path: (
+            sorted(files_by_artifact_id) if path.endswith("upload_queue")
+            else files_by_artifact_id[path.split("/")[-1]])
+        session = MagicMock()
+        file_service = FileService(artifact_service, MagicMock(), False, os_service, session=session,
+                                   upload_workers=1, upload_retry_backoff=0)
+        return file_service, session
+
+
+class FakeDriverFileExtension(DriverFileExtension):
+    def __init__(self, content):
+        super(FakeDriverFileExtension, self).__init__(MagicMock())
+        self._content = content
+
+    def shared_file(self):
+        return "Sample List"
+
+    def content(self):
+        return self._content
+
+    def newline(self):
+        return "\r\n"
+
+    def integration_tests(self):
+        return []
+
 
 def fake_artifact(artifact_id, name):
     artifact = Artifact()
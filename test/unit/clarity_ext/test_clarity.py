@@ -0,0 +1,55 @@
+import unittest
+import requests
+from mock import MagicMock, patch
+from clarity_ext.clarity import SessionRegistry
+
+
+class TestSessionRegistry(unittest.TestCase):
+
+    def test_version_is_checked_once_per_api(self):
+        registry = SessionRegistry()
+        api = MagicMock()
+        registry.check_version(api)
+        registry.check_version(api)
+        api.check_version.assert_called_once()
+
+    @patch("clarity_ext.clarity.Lims")
+    def test_api_is_shared(self, lims):
+        registry = SessionRegistry()
+        first = registry.api("http://lims", "user", "pw")
+        second = registry.api("http://lims", "user", "pw")
+        self.assertIs(first, second)
+        lims.assert_called_once_with("http://lims", "user", "pw")
+
+    @patch("clarity_ext.clarity.Lims")
+    def test_api_is_created_again_after_reset(self, lims):
+        registry = SessionRegistry()
+        registry.api("http://lims", "user", "pw")
+        registry.reset()
+        registry.api("http://lims", "user", "pw")
+        self.assertEqual(2, lims.call_count)
+
+    @patch("clarity_ext.clarity.Lims")
+    def test_api_is_created_again_when_requests_session_is_replaced(self, lims):
+        lims.side_effect = lambda *args: MagicMock()
+        registry = SessionRegistry()
+        first = registry.api("http://lims", "user", "pw")
+        with patch("clarity_ext.clarity.requests.Session", CachedSession):
+            session = registry.http_session
+            second = registry.api("http://lims", "user", "pw")
+            self.assertIs(session, registry.http_session)
+        self.assertIsInstance(session, CachedSession)
+        self.assertIsNot(first, second)
+        self.assertIs(session, second.request_session)
+        self.assertEqual([("http://lims", "user", "pw")], list(registry._apis.keys()))
+
+    @patch("clarity_ext.clarity.logger")
+    @patch("clarity_ext.clarity.Lims")
+    def test_warns_when_genologics_does_not_support_sharing_the_session(self, lims, logger):
+        del lims.return_value.request_session
+        SessionRegistry().api("http://lims", "user", "pw")
+        self.assertTrue(logger.warning.called)
+
+
+class CachedSession(requests.Session):
+    pass
@@ -1,6 +1,9 @@
+import os
+import shutil
+import tempfile
 import unittest
-from mock import Mock
-from clarity_ext.utils import lazyprop
+from mock import Mock, patch
+from clarity_ext.utils import lazyprop, replace_file
 
 
 class UsesLazyProp:
@@ -27,3 +30,19 @@ class TestUtils(unittest.TestCase):
         self.assertEqual(val1, 100)
         self.assertEqual(val1, val2)
         mock.assert_called_once()
+
+    def test_replace_file_replaces_existing_file(self):
+        for os_name in ["posix", "nt"]:
+            temp_dir = tempfile.mkdtemp()
+            try:
+                src, dst = os.path.join(temp_dir, "src"), os.path.join(temp_dir, "dst")
+                for path, content in [(src, "new"), (dst, "old")]:
+                    with open(path, "w") as f:
+                        f.write(content)
+                with patch("clarity_ext.utils.os.name", os_name):
+                    replace_file(src, dst)
+                with open(dst) as f:
+                    self.assertEqual("new", f.read())
+                self.assertFalse(os.path.exists(src))
+            finally:
+                shutil.rmtree(temp_dir)
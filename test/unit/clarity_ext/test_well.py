@@ -1,5 +1,7 @@
+import copy
 import unittest
-from clarity_ext.domain import Container, ContainerPosition, Well
+from mock import MagicMock
+from clarity_ext.domain import Container, ContainerPosition, Well, PlateSize
 
 
 class WellTest(unittest.TestCase):
@@ -18,5 +20,55 @@ class WellTest(unittest.TestCase):
         assert_well("E:12", 93)
         assert_well("B:7", 50)
 
+    def test_wells_with_same_fields_are_equal(self):
+        plate = Container(container_type=Container.CONTAINER_TYPE_96_WELLS_PLATE)
+        well = Well(ContainerPosition.create("A:1"), plate)
+        self.assertFalse(hasattr(well, "__dict__"))
+        self.assertEqual(well, Well(ContainerPosition.create("A:1"), plate))
+        self.assertEqual(["position"], well.differing_fields(Well(ContainerPosition.create("B:1"), plate)))
+
+    def test_wells_are_created_on_access(self):
+        plate = Container(size=PlateSize(height=16, width=24))
+        plate["C:2"].artifact = "second"
+        plate[(1, 2)].artifact = "first"
+        self.assertEqual(2, len(plate._wells))
+        self.assertEqual(["A:2", "C:2"], [repr(well.position) for well in plate.occupied])
+        self.assertTrue((16, 24) in plate)
+        self.assertFalse((17, 1) in plate)
+        self.assertEqual(384, len(plate.list_wells()))
+
+    def test_positions_are_interned(self):
+        pos = ContainerPosition.create("B:3")
+        self.assertIs(pos, ContainerPosition.create("2:3"))
+        self.assertIs(pos, ContainerPosition.create(("B", 3)))
+        self.assertIs(pos, ContainerPosition(row=2, col=3))
+        self.assertIs(ContainerPosition.create((30, 40)), ContainerPosition(30, 40))
+
+    def test_wells_in_mapping_are_occupied(self):
+        plate = Container(mapping={"3:2": "second", "1:2": "first"}, size=PlateSize(height=8, width=12))
+        self.assertEqual(["A:2", "C:2"], [repr(well.position) for well in plate.occupied])
+        self.assertEqual("first", plate["A:2"].artifact)
+
+    def test_copies_have_wells_of_their_own(self):
+        plate = Container(size=PlateSize(height=8, width=12))
+        first, second, third = MagicMock(), MagicMock(), MagicMock()
+        plate.append(first)
+        copied = copy.copy(plate)
+        copied.append(second)
+        plate["H:12"].artifact = third
+        self.assertEqual([first, third], [well.artifact for well in plate.occupied])
+        self.assertEqual([first, second], [well.artifact for well in copied.occupied])
+        self.assertEqual("B:1", repr(second.well.position))
+        self.assertIs(copied, copied["A:1"].container)
+
+    def test_append_fills_the_container_in_order(self):
+        plate = Container(size=PlateSize(height=2, width=2), append_order=Container.RIGHT_FIRST)
+        artifacts = [MagicMock() for _ in range(4)]
+        for artifact in artifacts:
+            plate.append(artifact)
+        self.assertEqual(["A:1", "A:2", "B:1", "B:2"], [repr(artifact.well.position) for artifact in artifacts])
+        self.assertRaises(StopIteration, plate.append, MagicMock())
+
+
 if __name__ == "__main__":
     unittest.main()